@@ -1,76 +1,290 @@
 import cv2
+import os
+import time
 import numpy as np
-from gelsightmini import DisplacementTracker
-from collections import deque
+from gelsightmini import DisplacementTracker, StereoLKTracker
+from capture import StereoCapture
+from contact_gate import ContactGate
+from tracking_pool import TrackingPool
+from displacement_history import DisplacementHistory, RollingWindowStats, RunningMeanField
+from instrumentation import traced
+from session_recorder import recorded_output
 
 
 class GSmini:
-      def __init__(self):
-            self.displacement_tracker_l = DisplacementTracker(device_num=3)
-            self.displacement_history_l = deque(maxlen=30)  # Store data for 1 seconds.
-            self.displacement_tracker_r = DisplacementTracker(device_num=0)
-            self.displacement_history_r = deque(maxlen=30)  # Store data for 1 seconds.
+      DEVICE_L = 3      # 左侧传感器设备号
+      DEVICE_R = 0      # 右侧传感器设备号
+      INIT_READ_TIMEOUT = 5.0     # 初始化时等待第一对图像的最长时间(秒)
+
+      def __init__(self, window=30, keep_frames=False, threaded_capture=False,
+                   source_l=None, source_r=None, contact_frames=2, slip_frames=5,
+                   disturbance_frames=5, buffer_pool=False, predictor=None,
+                   partial_tracking=False, contact_gate=False, init_cache_dir=None, warmup_frames=3,
+                   gs_config=None, process_pool=False, combined_lk=False, tracer=None):
+            """
+            Args:
+                  window: 位移历史保存的帧数（默认30帧，约1秒）
+                  keep_frames: 是否同时保留原始图像帧
+                  threaded_capture: 是否由后台线程并发采集左右传感器图像。只支持实时相机：
+                        回放、合成图像等非实时来源（FrameSource.live 为 False）会被后台线程尽快读取并丢帧，因此不允许
+                  source_l, source_r: 自定义左右图像来源（FrameSource），未提供时使用实时相机
+                  contact_frames: 接触判断使用的帧数
+                  slip_frames: 滑移和滚动判断需要连续满足条件的帧数
+                  disturbance_frames: 扰动识别中计算平均位移场的历史帧数
+                  buffer_pool: 追踪器是否复用预分配缓冲区（位移历史会拷贝每帧数据，可以安全开启）
+                  predictor: 标记点运动预测方式（None、'constant_velocity' 或 'kalman'），见 DisplacementTracker
+                  partial_tracking: 是否允许部分标记点丢失时继续追踪，见 DisplacementTracker
+                  contact_gate: 是否启用低开销的接触预检测（ContactGate）。
+                        启用后 get_frame(track=False) 只在预检测触发时才进行完整追踪
+                  init_cache_dir: 标记点初始化缓存目录，按设备号分别保存；重启时校验通过即可跳过标记点检测
+                  warmup_frames: 初始化后预先处理的帧数
+                  gs_config: 已加载的 GelSight 配置，左右传感器共用，未提供时各自读取
+                  process_pool: 是否在独立的工作进程中追踪左右传感器（TrackingPool），
+                        图像和结果通过共享内存传递，两路光流可以同时占用两个 CPU 核
+                  combined_lk: 是否将左右两路拼接后用一次光流调用追踪（StereoLKTracker），不支持 predictor，
+                        不能与 process_pool 同时使用
+                  tracer: 可选的 instrumentation.Tracer，记录采集、追踪和各检测器的耗时，并为每帧分配追踪编号
+            """
+            if threaded_capture:
+                  for source in (source_l, source_r):
+                        if source is not None and not getattr(source, 'live', True):
+                              raise ValueError(f"threaded_capture 只支持实时相机，"
+                                               f"{type(source).__name__} 不是实时图像来源")
+            if process_pool and combined_lk:
+                  raise ValueError("process_pool 与 combined_lk 不能同时使用："
+                                   "工作进程各自追踪一个传感器，无法合并为一次光流调用")
+            self.tracer = tracer
+            self.contact_frames = contact_frames
+            self.slip_frames = slip_frames
+            self.displacement_tracker_l = DisplacementTracker(device_num=self.DEVICE_L, source=source_l, buffer_pool=buffer_pool,
+                                                              predictor=predictor,
+                                                              partial_tracking=partial_tracking,
+                                                              gs_config=gs_config)
+            self.displacement_history_l = DisplacementHistory(window, keep_frames, self.make_stats())
+            self.displacement_tracker_r = DisplacementTracker(device_num=self.DEVICE_R, source=source_r, buffer_pool=buffer_pool,
+                                                              predictor=predictor,
+                                                              partial_tracking=partial_tracking,
+                                                              gs_config=gs_config)
+            self.displacement_history_r = DisplacementHistory(window, keep_frames, self.make_stats())
+            self.displacement_tracker_l.tracer = tracer
+            self.displacement_tracker_r.tracer = tracer
+            self.mean_field_l = RunningMeanField(disturbance_frames)
+            self.mean_field_r = RunningMeanField(disturbance_frames)
+            self.contact_gate_l = ContactGate() if contact_gate else None
+            self.contact_gate_r = ContactGate() if contact_gate else None
+            self.tracking_active = True     # 最近一帧是否进行了完整追踪
+            # 最近一帧的数据和本帧各检测器的输出，供 SessionRecorder 记录
+            self.last_records = (None, None)
+            self.last_frames = (None, None)
+            self.last_timestamp = 0.0
+            self.outputs = {}
+            self.init_cache_dir = init_cache_dir
+            self.process_pool = process_pool
+            self.tracker_kwargs = dict(buffer_pool=buffer_pool, predictor=predictor,
+                                       partial_tracking=partial_tracking)
+            self.tracking_pool = None
+            self.combined_lk = combined_lk
+            self.stereo_tracker = None
+            self.warmup_frames = warmup_frames
+            self.threaded_capture = threaded_capture
+            self.capture = None
             self.initialized = False
 
-      def initialize(self):
-            frame_l = self.displacement_tracker_l.cam_stream.update(1 / 30.0)
-            self.displacement_tracker_l.initialize(frame_l)
-            frame_r = self.displacement_tracker_r.cam_stream.update(1 / 30.0)
-            self.displacement_tracker_r.initialize(frame_r)
+      def make_stats(self):
+            """
+            Per-sensor rolling statistics, updated in O(1) as each frame is ingested.
+            """
+            return {
+                  'mean_total': RollingWindowStats(self.contact_frames),
+                  'mean_dx': RollingWindowStats(self.slip_frames, threshold=0.5),
+                  'mean_dy': RollingWindowStats(self.slip_frames, threshold=1.0),
+            }
+
+      def initialize(self, marker_centers_l=None, marker_centers_r=None):
+            """
+            Args:
+                  marker_centers_l, marker_centers_r: 已知的初始标记点中心，未提供时由 MarkerTracker 检测
+            """
+            if self.threaded_capture:
+                  self.capture = StereoCapture(self.displacement_tracker_l.cam_stream,
+                                               self.displacement_tracker_r.cam_stream)
+                  self.capture.start()
+
+            frame_l, frame_r = self.read_initial_frames()
+            if self.process_pool:
+                  # 追踪在工作进程中进行，本进程的追踪器只负责提供相机流
+                  if self.tracking_pool is None:
+                        self.tracking_pool = TrackingPool(2, [frame_l.shape, frame_r.shape], **self.tracker_kwargs)
+                        self.tracking_pool.start()
+                  self.tracking_pool.initialize(0, frame_l, marker_centers_l, self.init_cache_path(self.DEVICE_L))
+                  self.tracking_pool.initialize(1, frame_r, marker_centers_r, self.init_cache_path(self.DEVICE_R))
+            else:
+                  self.displacement_tracker_l.initialize(frame_l, marker_centers_l, self.init_cache_path(self.DEVICE_L))
+                  self.displacement_tracker_r.initialize(frame_r, marker_centers_r, self.init_cache_path(self.DEVICE_R))
+                  if self.combined_lk:
+                        self.stereo_tracker = StereoLKTracker(self.displacement_tracker_l, self.displacement_tracker_r)
 
-            for i in range(3):
+            # 初始化时传感器无接触，作为接触预检测的参考帧
+            if self.contact_gate_l is not None:
+                  self.contact_gate_l.set_reference(frame_l)
+                  self.contact_gate_r.set_reference(frame_r)
+
+            for i in range(self.warmup_frames):
                   self.get_frame()
             self.initialized = True
             print('initialize success')
       
-      def get_frame(self):
+      def init_cache_path(self, device_num):
+            """设备对应的标记点初始化缓存文件，未设置缓存目录时返回 None"""
+            if self.init_cache_dir is None:
+                  return None
+            return os.path.join(self.init_cache_dir, f'markers_device{device_num}.npz')
+
+      def read_initial_frames(self):
             """
-            Get frame and restore it.
+            读取初始化用的第一对图像。相机刚打开时可能暂时没有图像，
+            在 INIT_READ_TIMEOUT 秒内重试，仍读不到时抛出 RuntimeError
+            """
+            deadline = time.monotonic() + self.INIT_READ_TIMEOUT
+            while True:
+                  frame_l, frame_r, _, _ = self.read_frames()
+                  if frame_l is not None and frame_r is not None:
+                        return frame_l, frame_r
+                  if time.monotonic() >= deadline:
+                        raise RuntimeError(f"{self.INIT_READ_TIMEOUT:.0f} 秒内未能读取到左右传感器图像")
+                  time.sleep(1 / 30.0)
+
+      def read_frames(self):
             """
-            frame = self.displacement_tracker_l.cam_stream.update(1 / 30.0)
-            self.displacement_history_l.append(frame)
+            Read a left/right frame pair.
 
-            frame = self.displacement_tracker_r.cam_stream.update(1 / 30.0)
-            self.displacement_history_r.append(frame)
+            Returns:
+                  tuple: (frame_l, frame_r, timestamp_l, timestamp_r)
+            """
+            if self.capture is not None:
+                  pair = self.capture.get_pair(timeout=1.0)
+                  if pair is None:
+                        return None, None, None, None
+                  return pair
+
+            frame_l = self.displacement_tracker_l.cam_stream.update(1 / 30.0)
+            timestamp_l = time.time()
+            frame_r = self.displacement_tracker_r.cam_stream.update(1 / 30.0)
+            timestamp_r = time.time()
+            return frame_l, frame_r, timestamp_l, timestamp_r
+
+      def get_frame(self, track=True):
+            """
+            Get frame and restore it.
+            Each frame is tracked exactly once here; detectors only read the stored records.
 
-            pass
+            Args:
+                  track: False 时（例如等待接触期间）先由接触预检测判断，
+                        只有预检测触发时才进行完整追踪；未启用 contact_gate 时总是追踪
+            """
+            tracer = self.tracer
+            start = time.perf_counter_ns()
+            frame_l, frame_r, timestamp_l, timestamp_r = self.read_frames()
+            if frame_l is None or frame_r is None:
+                  return False
+
+            # 新的一帧：以较早一路的采集时刻作为该帧的采集时刻
+            self.outputs.clear()
+            self.last_frames = (frame_l, frame_r)
+            self.last_timestamp = min(timestamp_l, timestamp_r)
+            if tracer is not None:
+                  tracer.begin_frame(self.last_timestamp)
+                  tracer.record_since('capture.wait', start)
+                  tracer.record_from_capture('capture.age', tracer.capture_time)
+
+            if not track and self.contact_gate_l is not None:
+                  # 两路都要更新参考帧状态，不能短路
+                  start = time.perf_counter_ns()
+                  open_l = self.contact_gate_l.update(frame_l)
+                  open_r = self.contact_gate_r.update(frame_r)
+                  if tracer is not None:
+                        tracer.record_since('contact_gate', start)
+                  if not (open_l or open_r):
+                        self.tracking_active = False
+                        return True
+
+            # 暂停追踪期间的历史已经过时，恢复追踪时清空，避免检测器读到旧数据
+            if not self.tracking_active:
+                  self.clear_history()
+                  self.tracking_active = True
+
+            start = time.perf_counter_ns()
+            if self.tracking_pool is not None:
+                  record_l, record_r = self.tracking_pool.track_all([frame_l, frame_r], [timestamp_l, timestamp_r])
+            elif self.stereo_tracker is not None:
+                  record_l, record_r = self.stereo_tracker.track(frame_l, frame_r, timestamp_l, timestamp_r)
+            else:
+                  record_l = self.displacement_tracker_l.track(frame_l, timestamp_l)
+                  record_r = self.displacement_tracker_r.track(frame_r, timestamp_r)
+            if tracer is not None:
+                  tracer.record_since('track', start)
+                  start = time.perf_counter_ns()
+
+            self.last_records = (record_l, record_r)
+            self.displacement_history_l.append(record_l, frame_l)
+            self.displacement_history_r.append(record_r, frame_r)
+            self.mean_field_l.update(record_l.field, record_l.valid)
+            self.mean_field_r.update(record_r.field, record_r.valid)
+            if tracer is not None:
+                  tracer.record_since('history', start)
+            return True
+
+      def clear_history(self):
+            """清空位移历史和滑动平均位移场"""
+            self.displacement_history_l.clear()
+            self.displacement_history_r.clear()
+            self.mean_field_l.clear()
+            self.mean_field_r.clear()
+
+      def close(self):
+            """Stop the background capture threads and tracking worker processes."""
+            if self.capture is not None:
+                  self.capture.stop()
+                  self.capture = None
+            if self.tracking_pool is not None:
+                  self.tracking_pool.stop()
+                  self.tracking_pool = None
       
+      @traced('detect.contact')
+      @recorded_output('contact')
       def judge_contact(self):
             """
             Determine whether there has been contact, 
             which will be used to assess whether it is necessary to initiate gripping 
             and whether to grip the water cup.
             """
+            # 接触预检测未触发时没有进行追踪，即无接触
+            if not self.tracking_active:
+                  return 0
+
+            stats_l = self.displacement_history_l.stats['mean_total']
+            stats_r = self.displacement_history_r.stats['mean_total']
+
             # 确保有足够的历史数据
-            if len(self.displacement_history_l) < 2 or len(self.displacement_history_r) < 2:
+            if not stats_l.full or not stats_r.full:
                   return 0
             
-            # 计算左手最近2帧的平均位移
-            recent_l_displacements = []
-            for i in [1, 2]:  # 访问最新的两帧：-1和-2
-                  disp_i = self.displacement_tracker_l.get_average_displacement(
-                        self.displacement_history_l[-i]
-                  )
-                  recent_l_displacements.append(disp_i)
-            avg_disp_l = np.mean(recent_l_displacements)
+            # 左手最近2帧的平均位移
+            avg_disp_l = stats_l.mean
 
             if avg_disp_l > 0.3:
                   return 1
 
-            # 计算右手最近2帧的平均位移
-            recent_r_displacements = []
-            for i in [1, 2]:
-                  disp_i = self.displacement_tracker_r.get_average_displacement(
-                        self.displacement_history_r[-i]
-                  )
-                  recent_r_displacements.append(disp_i)
-            avg_disp_r = np.mean(recent_r_displacements)
+            # 右手最近2帧的平均位移
+            avg_disp_r = stats_r.mean
 
             if avg_disp_r > 0.3:
                   return 1
             
             return 0
 
+      @traced('detect.slip')
+      @recorded_output('slip')
       def detect_slip(self):
             """
             The detection will determine whether there is a trend of sliding, 
@@ -82,69 +296,28 @@ class GSmini:
                         x_direction_slip: 是否在x方向发生滑移
                         y_direction_slip: 是否在y方向发生滑移
             """
-            # 确保有足够的历史数据进行5帧检测
-            if len(self.displacement_history_l) < 5 or len(self.displacement_history_r) < 5:
-                  return False, False
+            stats_l = self.displacement_history_l.stats
+            stats_r = self.displacement_history_r.stats
 
             # 检查x方向滑移：左右手都连续5帧x位移大于0.5
-            x_direction_slip = True
-
-            # 检查左手最近5帧的x方向位移
-            for i in range(1, 6):  # 访问最新的5帧：-1, -2, -3, -4, -5
-                  avg_l_dx, avg_l_dy = self.displacement_tracker_l.get_average_directional_displacement(
-                        self.displacement_history_l[-i]
-                  )
-                  if abs(avg_l_dx) <= 0.5:
-                        x_direction_slip = False
-                        break
-
-            # 如果左手满足条件，再检查右手
-            if x_direction_slip:
-                  for i in range(1, 6):  # 访问最新的5帧：-1, -2, -3, -4, -5
-                        avg_r_dx, avg_r_dy = self.displacement_tracker_r.get_average_directional_displacement(
-                        self.displacement_history_r[-i]
-                        )
-                        if abs(avg_r_dx) <= 0.5:
-                              x_direction_slip = False
-                              break
+            x_direction_slip = stats_l['mean_dx'].all_over() and stats_r['mean_dx'].all_over()
 
             # 检查y方向滑移：左右手都连续5帧y位移大于1.0
-            y_direction_slip = True
-
-            # 检查左手最近5帧的y方向位移
-            for i in range(1, 6):  # 访问最新的5帧：-1, -2, -3, -4, -5
-                  avg_l_dx, avg_l_dy = self.displacement_tracker_l.get_average_directional_displacement(
-                        self.displacement_history_l[-i]
-                  )
-                  if abs(avg_l_dy) <= 1.0:
-                        y_direction_slip = False
-                        break
-
-            # 如果左手满足条件，再检查右手
-            if y_direction_slip:
-                  for i in range(1, 6):  # 访问最新的5帧：-1, -2, -3, -4, -5
-                        avg_r_dx, avg_r_dy = self.displacement_tracker_r.get_average_directional_displacement(
-                        self.displacement_history_r[-i]
-                        )
-                        if abs(avg_r_dy) <= 1.0:
-                              y_direction_slip = False
-                              break
+            y_direction_slip = stats_l['mean_dy'].all_over() and stats_r['mean_dy'].all_over()
 
             return x_direction_slip, y_direction_slip
 
+      @traced('detect.weight')
+      @recorded_output('weight')
       def perceive_weight(self):
             """
             The weight of the water cup (water volume) is perceived, 
             calculated based on the linear relationship 
             between the y-direction displacement of the left and right hands
             """
-            # 获取左手最近帧的y方向位移（dy）
-            _, avg_l_dy = self.displacement_tracker_l.get_average_directional_displacement(
-                  self.displacement_history_l[-1])
-            
-            # 获取右手最近帧的y方向位移（dy）
-            _, avg_r_dy = self.displacement_tracker_r.get_average_directional_displacement(
-                  self.displacement_history_r[-1])
+            # 获取左右手最近帧的y方向位移（dy）
+            avg_l_dy = float(self.displacement_history_l.recent('mean_dy', 1)[-1])
+            avg_r_dy = float(self.displacement_history_r.recent('mean_dy', 1)[-1])
             
             # 根据给定公式计算水量
             liquid = 0.5 * (
@@ -154,67 +327,35 @@ class GSmini:
             
             return liquid
 
-      def identify_disturbance(self, threshold=0.5, n_frames=5):
+      @traced('detect.disturbance')
+      @recorded_output('disturbance')
+      def identify_disturbance(self, threshold=0.5, n_frames=None):
             """
             Identify if the water bottle is being disturbed.
 
             Args:
                   threshold: 扰动阈值，超过此值认为不是扰动
-                  n_frames: 用于计算平均位移场的历史帧数
+                  n_frames: 用于计算平均位移场的历史帧数，默认使用 disturbance_frames
 
             Returns:
                   bool: True表示检测到扰动，False表示没有扰动
             """
+            if n_frames is None or n_frames == self.mean_field_l.n_frames:
+                  return self.identify_disturbance_running(threshold)
+
+            # 窗口长度与滑动均值不同时，从位移历史中直接计算
+            # （历史帧不足时无法判断；n_frames 不小于位移历史窗口长度时总是如此）
             if len(self.displacement_history_l) < n_frames + 1:
                   return False
 
-            # 当前帧位移
-            current_l_dx, current_l_dy = self.displacement_tracker_l.get_directional_displacement_every_point(
-                  self.displacement_history_l[-1])
-            current_r_dx, current_r_dy = self.displacement_tracker_r.get_directional_displacement_every_point(
-                  self.displacement_history_r[-1])
-
-            # 检查是否成功计算当前帧位移
-            if current_l_dx is None or current_r_dx is None:
-                  return False
+            # 与滑动均值相同，两个传感器各自跳过自己追踪失败的帧
+            diff_l = self.deviation_from_history(self.displacement_history_l, n_frames)
+            diff_r = self.deviation_from_history(self.displacement_history_r, n_frames)
 
-            # 累积历史位移
-            valid_count = 0
-            sum_l_dx = np.zeros_like(current_l_dx)
-            sum_l_dy = np.zeros_like(current_l_dy)
-            sum_r_dx = np.zeros_like(current_r_dx)
-            sum_r_dy = np.zeros_like(current_r_dy)
-
-            for i in range(2, n_frames + 2):  # 取过去 n_frames 帧
-                  past_l_dx, past_l_dy = self.displacement_tracker_l.get_directional_displacement_every_point(
-                        self.displacement_history_l[-i])
-                  past_r_dx, past_r_dy = self.displacement_tracker_r.get_directional_displacement_every_point(
-                        self.displacement_history_r[-i])
-
-                  # 跳过无效帧
-                  if past_l_dx is None or past_r_dx is None:
-                        continue
-
-                  sum_l_dx += past_l_dx
-                  sum_l_dy += past_l_dy
-                  sum_r_dx += past_r_dx
-                  sum_r_dy += past_r_dy
-                  valid_count += 1
-
-            # 若有效帧不足，无法判断
-            if valid_count == 0:
+            # 当前帧未成功计算位移，或无有效历史帧，无法判断
+            if diff_l is None or diff_r is None:
                   return False
 
-            # 平均位移
-            avg_l_dx = sum_l_dx / valid_count
-            avg_l_dy = sum_l_dy / valid_count
-            avg_r_dx = sum_r_dx / valid_count
-            avg_r_dy = sum_r_dy / valid_count
-
-            # 计算欧式距离差异
-            diff_l = np.sqrt((current_l_dx - avg_l_dx) ** 2 + (current_l_dy - avg_l_dy) ** 2)
-            diff_r = np.sqrt((current_r_dx - avg_r_dx) ** 2 + (current_r_dy - avg_r_dy) ** 2)
-
             # 判断是否有超过21个点超过扰动阈值
             over_threshold_l = np.sum(diff_l > threshold)
             over_threshold_r = np.sum(diff_r > threshold)
@@ -224,37 +365,64 @@ class GSmini:
             else:
                   return False   # 是扰动
 
+      @staticmethod
+      def deviation_from_history(history, n_frames):
+            """
+            当前帧每个点相对之前 n_frames 帧中有效帧平均位移场的欧式距离
+            :return: shape (nct,)；当前帧无效或没有有效历史帧时返回 None
+            """
+            # 最近 n_frames + 1 帧的位移场，最后一帧为当前帧
+            fields = history.recent_fields(n_frames + 1)
+            valid = history.recent('valid', n_frames + 1)
+            if not valid[-1]:
+                  return None
+
+            # 跳过无效的历史帧
+            past_valid = valid[:-1]
+            if not past_valid.any():
+                  return None
+
+            avg = fields[:-1][past_valid].mean(axis=0)
+            return np.linalg.norm(fields[-1] - avg, axis=1)
+
+      def identify_disturbance_running(self, threshold=0.5):
+            """
+            identify_disturbance using the per-sensor running mean fields,
+            O(nct) regardless of the window length.
+            """
+            if not self.mean_field_l.ready or not self.mean_field_r.ready:
+                  return False
+
+            # 检查是否成功计算当前帧位移
+            if not self.mean_field_l.latest_valid or not self.mean_field_r.latest_valid:
+                  return False
+
+            # 当前帧偏离历史平均位移场超过阈值的点数；若无有效历史帧，无法判断
+            over_threshold_l = self.mean_field_l.count_deviations(threshold)
+            over_threshold_r = self.mean_field_r.count_deviations(threshold)
+            if over_threshold_l is None or over_threshold_r is None:
+                  return False
+
+            # 判断是否有超过21个点超过扰动阈值
+            return over_threshold_l > 21 or over_threshold_r > 21
+
+      @traced('detect.scroll')
+      @recorded_output('scroll')
       def detect_scroll(self):
             """
             Determine whether the water cup is rolling 
             (i.e., when the bottle cap is being twisted).
             """
-            # 确保有足够的历史数据进行5帧检测
-            if len(self.displacement_history_l) < 5 or len(self.displacement_history_r) < 5:
-                  return False
-            
-            # 检查y方向滑移：左右手都连续5帧y位移大于1.0
-            is_rolling = True
-            
-            # 检查左手最近5帧的y方向位移
-            for i in range(1, 6):  # 访问最新的5帧：-1, -2, -3, -4, -5
-                  avg_l_dx, avg_l_dy = self.displacement_tracker_l.get_average_directional_displacement(
-                        self.displacement_history_l[-i]
-                  )
-                  if abs(avg_l_dx) <= 0.5:
-                        is_rolling = False
-                        break
-
-            for i in range(1, 6):  # 访问最新的5帧：-1, -2, -3, -4, -5
-                        avg_r_dx, avg_r_dy = self.displacement_tracker_r.get_average_directional_displacement(
-                        self.displacement_history_r[-i]
-                        )
-                        if abs(avg_r_dx) <= 0.5:
-                              is_rolling = False
-                              break
-            
+            dx_l = self.displacement_history_l.stats['mean_dx']
+            dx_r = self.displacement_history_r.stats['mean_dx']
+
+            # 检查x方向位移：左右手都连续5帧x位移大于0.5
+            is_rolling = dx_l.all_over() and dx_r.all_over()
+
             # 如果平移方向相反，那么就认为在滚动；否则不是
-            if avg_l_dx * avg_r_dx < 0:
+            # （以窗口内最早一帧的方向为准）
+            oldest = self.slip_frames - 1
+            if dx_l.recent(oldest) * dx_r.recent(oldest) < 0:
                   is_rolling = False
             
-            return is_rolling
\ No newline at end of file
+            return is_rolling
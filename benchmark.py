@@ -0,0 +1,336 @@
+"""
+触觉处理流水线性能测试
+
+使用合成的 GelSight 标记点图像（位移场已知），测量 DisplacementTracker 和 GSmini
+各阶段的延迟分位数与吞吐量，并将结果写入 JSON 文件以便对比不同版本。
+无需连接传感器，可在纯 CPU 环境下复现。
+
+用法:
+    python benchmark.py --frames 300 --motion shear_x --output bench.json
+"""
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from frame_source import FrameSource, SyntheticMarkerSource
+from gelsightmini import DisplacementTracker, StereoLKTracker
+from GSmini import GSmini
+from tracking_pool import TrackingPool
+
+PERCENTILES = (50, 90, 99)
+
+TRACKER_STAGES = (
+    'track',
+    'get_comprehensive_displacement',
+    'get_displacement_field',
+)
+
+GSMINI_STAGES = (
+    'judge_contact',
+    'detect_slip',
+    'detect_scroll',
+    'identify_disturbance',
+    'perceive_weight',
+)
+
+
+class FrameListSource(FrameSource):
+    """循环回放预先渲染好的帧，避免把渲染耗时计入测试结果"""
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def update(self, dt):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame
+
+
+def summarize(samples_ns):
+    """计算延迟统计（毫秒）和吞吐量（次/秒）"""
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    mean = float(samples.mean())
+    result = {
+        'count': int(len(samples)),
+        'mean_ms': mean,
+        'min_ms': float(samples.min()),
+        'max_ms': float(samples.max()),
+    }
+    for p in PERCENTILES:
+        result[f'p{p}_ms'] = float(np.percentile(samples, p))
+    result['throughput_hz'] = 1000.0 / mean if mean > 0 else float('inf')
+    return result
+
+
+def measure(fn, n):
+    """调用 fn() n 次，返回每次耗时（纳秒）"""
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - t0)
+    return samples
+
+
+def make_source(args, seed=0):
+    return SyntheticMarkerSource(
+        width=args.width,
+        height=args.height,
+        rows=args.rows,
+        cols=args.cols,
+        motion=args.motion,
+        amplitude=args.amplitude,
+        noise=args.noise,
+        seed=seed,
+    )
+
+
+def render_frames(source, n):
+    return [source.update(0) for _ in range(n)]
+
+
+def marker_centers(args, source):
+    """--detect-markers 时由 MarkerTracker 检测标记点，否则使用合成图像的真实位置"""
+    return None if args.detect_markers else source.marker_centers
+
+
+def new_tracker(args, frames, source, buffer_pool=False, predictor=None):
+    tracker = DisplacementTracker(source=FrameListSource(frames), buffer_pool=buffer_pool,
+                                  predictor=predictor)
+    tracker.initialize(frames[0], marker_centers(args, source))
+    return tracker
+
+
+def bench_initialize(args, frames, source):
+    tracker = DisplacementTracker(source=FrameListSource(frames))
+    centers = marker_centers(args, source)
+    return measure(lambda: tracker.initialize(frames[0], centers), args.init_repeat)
+
+
+def bench_tracker_stage(args, frames, source, stage, buffer_pool=False, predictor=None):
+    tracker = new_tracker(args, frames, source, buffer_pool, predictor)
+    method = getattr(tracker, stage)
+    frame_iter = iter(frames[1:])
+    samples = measure(lambda: method(next(frame_iter)), len(frames) - 1)
+    return samples[args.warmup:]
+
+
+def measure_allocations(args, frames, source, buffer_pool):
+    """
+    稳态下 track() 的 Python/NumPy 内存分配情况（tracemalloc 统计）
+    :return: {'peak_bytes': 追踪期间相对起点的峰值增量, 'frame_bytes': 单帧灰度图大小}
+    """
+    tracker = new_tracker(args, frames, source, buffer_pool)
+    for frame in frames[1:args.warmup + 1]:
+        tracker.track(frame)
+
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    for frame in frames[args.warmup + 1:]:
+        tracker.track(frame)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'peak_bytes': peak - start,
+        'frame_bytes': int(frames[0].shape[0] * frames[0].shape[1]),
+    }
+
+
+def bench_gsmini(args, frames_l, frames_r, source):
+    """逐帧测量 GSmini.get_frame 以及每个检测器的耗时"""
+    gsmini = GSmini(source_l=FrameListSource(frames_l), source_r=FrameListSource(frames_r))
+    centers = marker_centers(args, source)
+    gsmini.initialize(centers, centers)
+
+    samples = {'get_frame': []}
+    samples.update({stage: [] for stage in GSMINI_STAGES})
+    for i in range(args.frames):
+        t0 = time.perf_counter_ns()
+        gsmini.get_frame()
+        samples['get_frame'].append(time.perf_counter_ns() - t0)
+        for stage in GSMINI_STAGES:
+            method = getattr(gsmini, stage)
+            t0 = time.perf_counter_ns()
+            method()
+            samples[stage].append(time.perf_counter_ns() - t0)
+    return {stage: s[args.warmup:] for stage, s in samples.items()}
+
+
+def bench_idle(args):
+    """
+    等待接触（传感器无接触）时每帧的处理耗时：
+    完整追踪 get_frame() 与接触预检测 get_frame(track=False) 对比
+    """
+    source_l = make_source(args, seed=0)
+    source_r = make_source(args, seed=1)
+    frames_l = [source_l.render(source_l.true_field(0)) for _ in range(args.frames + 1)]
+    frames_r = [source_r.render(source_r.true_field(0)) for _ in range(args.frames + 1)]
+    centers = marker_centers(args, source_l)
+
+    results = {}
+    for name, track in (('get_frame[idle]', True), ('get_frame[idle, contact_gate]', False)):
+        gsmini = GSmini(source_l=FrameListSource(frames_l), source_r=FrameListSource(frames_r),
+                        contact_gate=True)
+        gsmini.initialize(centers, centers)
+        samples = measure(lambda: gsmini.get_frame(track=track), args.frames)
+        results[name] = samples[args.warmup:]
+    return results
+
+
+def bench_stereo(args, frames_l, frames_r, source_l, source_r):
+    """左右两路各调用一次光流与 StereoLKTracker 合并为一次调用的耗时对比"""
+    tracker_l = new_tracker(args, frames_l, source_l)
+    tracker_r = new_tracker(args, frames_r, source_r)
+    frame_iter = iter(range(1, len(frames_l)))
+
+    def track_separate():
+        k = next(frame_iter)
+        tracker_l.track(frames_l[k])
+        tracker_r.track(frames_r[k])
+
+    results = {'stereo.separate': measure(track_separate, len(frames_l) - 1)[args.warmup:]}
+
+    stereo = StereoLKTracker(new_tracker(args, frames_l, source_l), new_tracker(args, frames_r, source_r))
+    frame_iter = iter(range(1, len(frames_l)))
+
+    def track_combined():
+        k = next(frame_iter)
+        stereo.track(frames_l[k], frames_r[k])
+
+    results['stereo.combined'] = measure(track_combined, len(frames_l) - 1)[args.warmup:]
+    return results
+
+
+def bench_tracking_pool(args):
+    """
+    多个传感器每帧各追踪一次的总耗时：单进程依次追踪与 TrackingPool 多进程并行追踪对比
+    """
+    n = args.pool_sensors
+    sources = [make_source(args, seed=i) for i in range(n)]
+    frames = [render_frames(source, args.frames + 1) for source in sources]
+
+    trackers = [new_tracker(args, frames[i], sources[i]) for i in range(n)]
+    frame_iter = iter(range(1, args.frames + 1))
+
+    def track_sequential():
+        k = next(frame_iter)
+        for tracker, sensor_frames in zip(trackers, frames):
+            tracker.track(sensor_frames[k])
+
+    results = {f'sensors[{n}].sequential': measure(track_sequential, args.frames)[args.warmup:]}
+
+    pool = TrackingPool(n, frames[0][0].shape)
+    pool.start()
+    try:
+        for i in range(n):
+            pool.initialize(i, frames[i][0], marker_centers(args, sources[i]))
+        frame_iter = iter(range(1, args.frames + 1))
+
+        def track_pool():
+            k = next(frame_iter)
+            pool.track_all([sensor_frames[k] for sensor_frames in frames])
+
+        results[f'sensors[{n}].tracking_pool'] = measure(track_pool, args.frames)[args.warmup:]
+    finally:
+        pool.stop()
+    return results
+
+
+def run(args):
+    source_l = make_source(args, seed=0)
+    source_r = make_source(args, seed=1)
+    frames_l = render_frames(source_l, args.frames + 1)
+    frames_r = render_frames(source_r, args.frames + 1)
+
+    results = {}
+    results['tracker.initialize'] = summarize(bench_initialize(args, frames_l, source_l))
+    for stage in TRACKER_STAGES:
+        results[f'tracker.{stage}'] = summarize(bench_tracker_stage(args, frames_l, source_l, stage))
+    results['tracker.track[buffer_pool]'] = summarize(
+        bench_tracker_stage(args, frames_l, source_l, 'track', buffer_pool=True))
+    for predictor in DisplacementTracker.PREDICTORS:
+        results[f'tracker.track[{predictor}]'] = summarize(
+            bench_tracker_stage(args, frames_l, source_l, 'track', predictor=predictor))
+    for stage, samples in bench_gsmini(args, frames_l, frames_r, source_l).items():
+        results[f'gsmini.{stage}'] = summarize(samples)
+    for stage, samples in bench_stereo(args, frames_l, frames_r, source_l, source_r).items():
+        results[stage] = summarize(samples)
+    for stage, samples in bench_idle(args).items():
+        results[f'gsmini.{stage}'] = summarize(samples)
+    if args.pool_sensors > 0:
+        for stage, samples in bench_tracking_pool(args).items():
+            results[stage] = summarize(samples)
+    return results
+
+
+def print_results(results):
+    print('\n' + '=' * 96)
+    header = f"{'stage':<42}{'mean':>9}" + ''.join(f"{'p%d' % p:>9}" for p in PERCENTILES)
+    print(header + f"{'max':>9}{'Hz':>10}")
+    print('-' * 96)
+    for stage, r in results.items():
+        row = f"{stage:<42}{r['mean_ms']:9.3f}" + ''.join(f"{r[f'p{p}_ms']:9.3f}" for p in PERCENTILES)
+        print(row + f"{r['max_ms']:9.3f}{r['throughput_hz']:10.1f}")
+    print('=' * 96)
+    print('单位: 毫秒 (ms)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tactile processing pipeline.")
+    parser.add_argument('--width', type=int, default=320, help="合成图像宽度")
+    parser.add_argument('--height', type=int, default=240, help="合成图像高度")
+    parser.add_argument('--rows', type=int, default=7, help="标记点行数")
+    parser.add_argument('--cols', type=int, default=9, help="标记点列数")
+    parser.add_argument('--motion', type=str, default='shear_x',
+                        choices=SyntheticMarkerSource.MOTIONS, help="标记点运动模式")
+    parser.add_argument('--amplitude', type=float, default=3.0, help="运动幅度（像素或角度）")
+    parser.add_argument('--noise', type=float, default=2.0, help="图像噪声标准差")
+    parser.add_argument('--frames', type=int, default=300, help="每个阶段测试的帧数")
+    parser.add_argument('--warmup', type=int, default=10, help="丢弃的预热帧数")
+    parser.add_argument('--init-repeat', type=int, default=10, help="initialize 的重复次数")
+    parser.add_argument('--detect-markers', action='store_true',
+                        help="initialize 时使用 MarkerTracker 检测标记点")
+    parser.add_argument('--pool-sensors', type=int, default=0,
+                        help="同时测试多少个传感器的多进程追踪（TrackingPool），0 表示不测试")
+    parser.add_argument('--output', type=str, default=None, help="结果输出的 JSON 文件")
+    args = parser.parse_args()
+
+    results = run(args)
+    print_results(results)
+
+    # 稳态追踪的内存分配（仅报告；buffer_pool 模式的断言见 tests/test_buffer_pool.py）
+    allocations = {}
+    for mode, buffer_pool in (('default', False), ('buffer_pool', True)):
+        source = make_source(args)
+        frames = render_frames(source, min(args.frames, 100) + args.warmup + 1)
+        allocations[mode] = measure_allocations(args, frames, source, buffer_pool)
+        alloc = allocations[mode]
+        steady = alloc['peak_bytes'] < alloc['frame_bytes'] // 2
+        print(f"track() 内存分配 [{mode}]: 峰值增量 {alloc['peak_bytes']} 字节 "
+              f"(单帧灰度图 {alloc['frame_bytes']} 字节) - "
+              f"{'无大数组分配' if steady else '存在大数组分配'}")
+
+    if args.output:
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'opencv_threads': cv2.getNumThreads(),
+            'config': vars(args),
+            'results': results,
+            'allocations': allocations,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
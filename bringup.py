@@ -0,0 +1,123 @@
+"""
+系统并行启动
+
+GelSight 配置只读取一次，左右相机的打开和电爪的串口配置并发执行，
+两路相机打开后立即初始化触觉处理（此时电爪可能仍在配置中）。
+冷启动总耗时取决于最慢的一路，而不是各部分之和；每个阶段的耗时都会被记录并打印。
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from frame_source import LiveCameraSource, load_gs_config
+from gripper import ElectricGripperController
+from GSmini import GSmini
+
+
+class PhaseTimer:
+    """
+    记录各启动阶段的耗时（可在多个线程中同时使用）。
+    名称中含 ':' 的为子阶段（例如 'gripper:connect'），不计入串行耗时之和
+    """
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.phases = {}    # 阶段名 -> (开始时刻, 耗时)，时刻相对 start_time（秒）
+        self._lock = threading.Lock()
+
+    def run(self, phase, func, *args, **kwargs):
+        """执行 func 并记录耗时"""
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            t1 = time.perf_counter()
+            with self._lock:
+                self.phases[phase] = (t0 - self.start_time, t1 - t0)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def report(self):
+        """打印各阶段耗时以及总耗时与串行耗时之和的对比"""
+        print('\n' + '=' * 60)
+        print(f"{'phase':<32}{'start(s)':>12}{'time(s)':>12}")
+        print('-' * 60)
+        for phase, (start, duration) in sorted(self.phases.items(), key=lambda item: item[1][0]):
+            print(f"{phase:<32}{start:12.3f}{duration:12.3f}")
+        print('-' * 60)
+        serial_total = sum(duration for phase, (_, duration) in self.phases.items() if ':' not in phase)
+        print(f"总耗时 {self.elapsed:.3f}s（各阶段串行之和 {serial_total:.3f}s）")
+        print('=' * 60)
+
+
+def start_camera(device_num, gs_config):
+    """打开一路 GelSight 相机"""
+    source = LiveCameraSource(device_num, gs_config)
+    source.start()
+    return source
+
+
+def setup_gripper(timer, port, baudrate, slave_id, initial_force, grip_speed):
+    """连接并配置电爪，每一步分别计时"""
+    gripper = ElectricGripperController(port=port, baudrate=baudrate, slave_id=slave_id)
+    timer.run('gripper:connect', gripper.connect)
+    timer.run('gripper:test_connection', gripper.test_connection)
+    timer.run('gripper:set_control_mode', gripper.set_control_mode, 1)     # 设置为串口控制
+    timer.run('gripper:set_grip_current', gripper.set_grip_current, initial_force)     # 设置夹持力
+    timer.run('gripper:set_grip_speed', gripper.set_grip_speed, grip_speed)    # 设置夹持速度
+    timer.run('gripper:release', gripper.release)      # 松开夹持
+    timer.run('gripper:save_config', gripper.save_config)      # 保存设置
+    return gripper
+
+
+def bring_up(port='COM3', baudrate=115200, slave_id=1, initial_force=1000, grip_speed=2000,
+             config_path=None, **gsmini_kwargs):
+    """
+    并行启动触觉传感器和电爪
+    :param port, baudrate, slave_id: 电爪串口参数
+    :param initial_force: 初始夹持力
+    :param grip_speed: 夹持速度
+    :param config_path: GelSight 配置文件，未提供时从命令行参数 --gs-config 读取
+    :param gsmini_kwargs: 传给 GSmini 的其他参数
+    :return: (已初始化的 GSmini, 已配置的电爪, PhaseTimer)
+    """
+    timer = PhaseTimer()
+    gs_config = timer.run('config', load_gs_config, config_path)
+
+    futures = []
+    gsmini = None
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix='bringup') as pool:
+        try:
+            future_l = pool.submit(timer.run, 'camera_l', start_camera, GSmini.DEVICE_L, gs_config)
+            future_r = pool.submit(timer.run, 'camera_r', start_camera, GSmini.DEVICE_R, gs_config)
+            future_gripper = pool.submit(timer.run, 'gripper', setup_gripper, timer, port, baudrate,
+                                         slave_id, initial_force, grip_speed)
+            futures = [future_l, future_r, future_gripper]
+
+            # 相机就绪后立即初始化触觉处理，与电爪配置重叠进行
+            gsmini = GSmini(source_l=future_l.result(), source_r=future_r.result(),
+                            gs_config=gs_config, **gsmini_kwargs)
+            timer.run('gsmini.initialize', gsmini.initialize)
+            gripper = future_gripper.result()
+        except BaseException:
+            # 任意一路失败时，等其余各路结束后释放已经打开的设备
+            wait(futures)
+            if gsmini is not None:
+                gsmini.close()
+            shutdown_started(futures)
+            raise
+
+    timer.report()
+    return gsmini, gripper, timer
+
+
+def shutdown_started(futures):
+    """关闭已成功启动的相机和电爪"""
+    for future in futures:
+        if future.exception() is not None:
+            continue
+        device = future.result()
+        if isinstance(device, ElectricGripperController):
+            device.disconnect()
+        else:
+            device.stop()
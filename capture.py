@@ -0,0 +1,96 @@
+import threading
+import time
+
+
+class FrameGrabber(threading.Thread):
+    """
+    后台采集线程：持续调用相机流的 update()，只保留最新一帧。
+    控制循环读取最新帧时不会阻塞在相机等待上。
+    只适用于按自身帧率出帧的实时相机：回放或合成图像等不等待的来源会被尽快读取，
+    除最新一帧外全部丢弃。
+    """
+    def __init__(self, cam_stream, dt=1 / 30.0, condition=None, name=None):
+        super().__init__(name=name, daemon=True)
+        self.cam_stream = cam_stream
+        self.dt = dt
+        self.condition = condition if condition is not None else threading.Condition()
+
+        # 最新帧槽位
+        self.frame = None
+        self.timestamp = 0.0
+        self.seq = 0
+
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            frame = self.cam_stream.update(self.dt)
+            if frame is None:
+                # 暂时没有图像（或回放已结束）时等待一个帧间隔，避免空转
+                self._stop_event.wait(self.dt)
+                continue
+            timestamp = time.time()
+            with self.condition:
+                self.frame = frame
+                self.timestamp = timestamp
+                self.seq += 1
+                self.condition.notify_all()
+
+    def latest(self):
+        """返回 (frame, timestamp, seq)"""
+        with self.condition:
+            return self.frame, self.timestamp, self.seq
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class StereoCapture:
+    """
+    左右两个传感器的并发采集。
+    每个相机流运行在各自的 FrameGrabber 线程中，
+    get_pair() 直接返回带时间戳的最新左右帧对，总延迟取决于较慢的一路而不是两路之和。
+    """
+    def __init__(self, cam_stream_l, cam_stream_r, dt=1 / 30.0):
+        self.condition = threading.Condition()
+        self.grabber_l = FrameGrabber(cam_stream_l, dt, self.condition, name='capture-l')
+        self.grabber_r = FrameGrabber(cam_stream_r, dt, self.condition, name='capture-r')
+        self._last_seq = (0, 0)
+
+    def start(self):
+        self.grabber_l.start()
+        self.grabber_r.start()
+
+    def stop(self):
+        self.grabber_l.stop()
+        self.grabber_r.stop()
+
+    def _seqs(self):
+        return self.grabber_l.seq, self.grabber_r.seq
+
+    def _both_new(self):
+        """两路都有图像，且自上次取帧以来都产生了新帧"""
+        seq_l, seq_r = self._seqs()
+        last_l, last_r = self._last_seq
+        return (self.grabber_l.frame is not None and self.grabber_r.frame is not None and
+                seq_l != last_l and seq_r != last_r)
+
+    def get_pair(self, timeout=None):
+        """
+        获取最新的左右帧对。
+        最多等待 timeout 秒，直到自上次调用以来两路都产生了新帧，
+        因此返回的左右帧都不会是上一次已经返回过的帧（两路帧率不同时按较慢的一路出帧）。
+
+        Returns:
+            tuple: (frame_l, frame_r, timestamp_l, timestamp_r)，
+                任意一路尚无新图像或等待超时时返回 None
+        """
+        with self.condition:
+            has_new = self.condition.wait_for(self._both_new, timeout)
+            if not has_new:
+                return None
+            self._last_seq = self._seqs()
+            return (self.grabber_l.frame, self.grabber_r.frame,
+                    self.grabber_l.timestamp, self.grabber_r.timestamp)
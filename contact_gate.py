@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+
+
+class ContactGate:
+    """
+    低开销的接触预检测。
+    每帧先按 stride 间隔取像素，再面积平均降采样到原图的 1/scale 并转为灰度，
+    与无接触时的参考帧逐像素比较，最大灰度差超过 threshold 时触发。
+    全程只处理约 1/stride² 的像素，单帧开销比完整的标记点光流追踪低一个数量级，
+    适合在等待接触时代替追踪。
+
+    触发后在 hold_frames 帧内保持打开，避免接触刚开始时反复切换；
+    未触发时参考帧以 drift_rate 缓慢跟随当前帧，以适应光照的缓慢变化。
+    """
+    def __init__(self, scale=8, stride=4, threshold=12.0, hold_frames=30, drift_rate=0.02):
+        """
+        :param scale: 降采样倍数
+        :param stride: 降采样前的取像素间隔（不超过 scale）
+        :param threshold: 触发阈值（降采样后最大灰度差）
+        :param hold_frames: 触发后保持打开的帧数
+        :param drift_rate: 未触发时参考帧跟随当前帧的速率
+        """
+        self.scale = scale
+        self.stride = min(stride, scale)
+        self.threshold = threshold
+        self.hold_frames = hold_frames
+        self.drift_rate = drift_rate
+
+        self.reference = None   # 降采样参考帧, float32
+        self.score = 0.0        # 最近一帧与参考帧的最大灰度差
+        self.fired = False      # 最近一帧是否触发
+        self._hold = 0
+        self._size = None
+        self._small_rgb = None
+        self._small_gray = None
+        self._small = None
+        self._diff = None
+
+    def downsample(self, frame):
+        """降采样并灰度化，返回 float32 小图（复用内部缓冲区）"""
+        sampled = frame[::self.stride, ::self.stride]
+        self._small_rgb = cv2.resize(sampled, self._size, dst=self._small_rgb,
+                                     interpolation=cv2.INTER_AREA)
+        self._small_gray = cv2.cvtColor(self._small_rgb, cv2.COLOR_RGB2GRAY, dst=self._small_gray)
+        np.copyto(self._small, self._small_gray)
+        return self._small
+
+    def set_reference(self, frame):
+        """以无接触时的一帧作为参考帧"""
+        h, w = frame.shape[:2]
+        self._size = (max(1, w // self.scale), max(1, h // self.scale))
+        self._small_rgb = None
+        self._small_gray = None
+        self._small = np.empty(self._size[::-1], dtype=np.float32)
+        self._diff = np.empty_like(self._small)
+        self.reference = self.downsample(frame).copy()
+        self.score = 0.0
+        self.fired = False
+        self._hold = 0
+
+    @property
+    def open(self):
+        """是否需要进行完整追踪（最近触发过且仍在保持期内）"""
+        return self._hold > 0
+
+    def update(self, frame):
+        """
+        比较当前帧与参考帧
+        :return: 是否需要进行完整追踪
+        """
+        small = self.downsample(frame)
+        cv2.absdiff(small, self.reference, dst=self._diff)
+        self.score = float(self._diff.max())
+        self.fired = self.score > self.threshold
+
+        if self.fired:
+            self._hold = self.hold_frames
+        else:
+            if self._hold > 0:
+                self._hold -= 1
+            cv2.accumulateWeighted(small, self.reference, self.drift_rate)
+        return self.open
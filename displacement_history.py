@@ -0,0 +1,271 @@
+import numpy as np
+from collections import deque
+
+
+class DisplacementHistory:
+    """
+    定长的位移历史环形缓冲区。
+
+    每帧只保存 (nct, 2) 的 float32 位移场、追踪状态、标量统计和时间戳，
+    原始图像帧仅在 keep_frames=True 时保留。
+    缓冲区采用双倍长度存储：每帧同时写入 i 和 i + window 两个位置，
+    因此任意最近 n 帧都是一段连续的 NumPy 切片，查询无需拷贝。
+    """
+    def __init__(self, window=30, keep_frames=False, stats=None):
+        """
+        :param window: 保存的帧数
+        :param keep_frames: 是否同时保留原始图像帧
+        :param stats: 随每帧增量更新的滑动窗口统计 {记录属性名: RollingWindowStats}，
+                      例如 {'mean_dx': RollingWindowStats(5, threshold=0.5)}
+        """
+        self.window = window
+        self.keep_frames = keep_frames
+        self.stats = stats if stats is not None else {}
+        self.frames = deque(maxlen=window) if keep_frames else None
+        self.nct = 0
+        self.count = 0          # 累计写入的帧数
+        self._end = 0           # 最新一帧在双倍缓冲区中的下一个位置
+
+        self.fields = None      # 位移场, shape: (2 * window, nct, 2)
+        self.status = None      # 每个点是否追踪成功, shape: (2 * window, nct)
+        self.valid = np.zeros(2 * window, dtype=bool)
+        self.mean_dx = np.zeros(2 * window, dtype=np.float32)
+        self.mean_dy = np.zeros(2 * window, dtype=np.float32)
+        self.mean_total = np.zeros(2 * window, dtype=np.float32)
+        self.timestamp = np.zeros(2 * window, dtype=np.float64)
+
+    def _allocate(self, nct):
+        """在第一帧到来时按标记点数量分配缓冲区"""
+        self.nct = nct
+        self.fields = np.zeros((2 * self.window, nct, 2), dtype=np.float32)
+        self.status = np.zeros((2 * self.window, nct), dtype=bool)
+
+    def append(self, record, frame=None):
+        """写入一帧的位移记录（DisplacementRecord）"""
+        if self.fields is None:
+            self._allocate(len(record.field))
+
+        i = self.count % self.window
+        for j in (i, i + self.window):
+            self.fields[j] = record.field
+            self.status[j] = record.status
+            self.valid[j] = record.valid
+            self.mean_dx[j] = record.mean_dx
+            self.mean_dy[j] = record.mean_dy
+            self.mean_total[j] = record.mean_total
+            self.timestamp[j] = record.timestamp
+
+        self.count += 1
+        self._end = i + self.window + 1
+
+        for name, stats in self.stats.items():
+            stats.update(getattr(record, name))
+
+        if self.keep_frames and frame is not None:
+            self.frames.append(frame)
+
+    def __len__(self):
+        return min(self.count, self.window)
+
+    def _slice(self, n):
+        """最近 n 帧在双倍缓冲区中的切片（按时间先后排列）"""
+        n = min(n, len(self))
+        return slice(self._end - n, self._end)
+
+    def recent(self, name, n):
+        """
+        获取最近 n 帧的某项标量统计，返回视图。
+        name 可选: 'mean_dx', 'mean_dy', 'mean_total', 'valid', 'timestamp'
+        """
+        return getattr(self, name)[self._slice(n)]
+
+    def recent_fields(self, n):
+        """获取最近 n 帧的位移场视图, shape: (n, nct, 2)"""
+        return self.fields[self._slice(n)]
+
+    def recent_status(self, n):
+        """获取最近 n 帧的追踪状态视图, shape: (n, nct)"""
+        return self.status[self._slice(n)]
+
+    def clear(self):
+        self.count = 0
+        self._end = 0
+        if self.frames is not None:
+            self.frames.clear()
+        for stats in self.stats.values():
+            stats.clear()
+
+
+class RollingWindowStats:
+    """
+    标量序列的滑动窗口统计，每帧 O(1) 更新:
+        mean:     窗口内均值
+        run_over: 连续超过阈值（绝对值）的帧数
+        sign_run: 与最新值同号的连续帧数
+        max/min:  窗口内最大/最小值（单调队列，均摊 O(1)）
+    检测器只需读取这些统计量，查询代价与窗口长度无关。
+    """
+    def __init__(self, window, threshold=None):
+        self.window = window
+        self.threshold = threshold
+        self.clear()
+
+    def clear(self):
+        self.values = [0.0] * self.window
+        self.count = 0
+        self.sum = 0.0
+        self.run_over = 0
+        self.sign_run = 0
+        self._sign = 0
+        self._max_queue = deque()   # (帧序号, 值)，值单调递减
+        self._min_queue = deque()   # (帧序号, 值)，值单调递增
+
+    def update(self, value):
+        value = float(value)
+        n = self.count
+        i = n % self.window
+
+        # 滑动窗口求和：移出最旧的值，加入新值
+        if n >= self.window:
+            self.sum -= self.values[i]
+        self.values[i] = value
+        self.count += 1
+        if i == self.window - 1:
+            # 每绕一圈重新求和一次，消除浮点累积误差
+            self.sum = sum(self.values)
+        else:
+            self.sum += value
+
+        # 连续超过阈值的帧数
+        if self.threshold is not None and abs(value) > self.threshold:
+            self.run_over += 1
+        else:
+            self.run_over = 0
+
+        # 同号连续帧数
+        sign = (value > 0) - (value < 0)
+        if sign != 0 and sign == self._sign:
+            self.sign_run += 1
+        else:
+            self.sign_run = 1 if sign != 0 else 0
+        self._sign = sign
+
+        # 窗口极值
+        while self._max_queue and self._max_queue[-1][1] <= value:
+            self._max_queue.pop()
+        self._max_queue.append((n, value))
+        while self._min_queue and self._min_queue[-1][1] >= value:
+            self._min_queue.pop()
+        self._min_queue.append((n, value))
+        oldest = n - self.window
+        if self._max_queue[0][0] <= oldest:
+            self._max_queue.popleft()
+        if self._min_queue[0][0] <= oldest:
+            self._min_queue.popleft()
+
+    def __len__(self):
+        return min(self.count, self.window)
+
+    @property
+    def full(self):
+        """窗口是否已填满"""
+        return self.count >= self.window
+
+    @property
+    def mean(self):
+        return self.sum / len(self) if self.count else 0.0
+
+    @property
+    def max(self):
+        return self._max_queue[0][1] if self.count else 0.0
+
+    @property
+    def min(self):
+        return self._min_queue[0][1] if self.count else 0.0
+
+    def recent(self, k=0):
+        """k 帧之前的值（k=0 为最新一帧）"""
+        return self.values[(self.count - 1 - k) % self.window]
+
+    def all_over(self, n=None):
+        """最近 n 帧（默认整个窗口）是否都超过阈值"""
+        return self.run_over >= (self.window if n is None else n)
+
+
+class RunningMeanField:
+    """
+    最近 n_frames 帧位移场的滑动和，窗口均值场的代价为 O(nct)，与 n_frames 无关。
+    最新一帧不计入窗口：均值始终对应“当前帧之前”的 n_frames 帧，追踪失败的帧不参与平均。
+    """
+    def __init__(self, n_frames):
+        self.n_frames = n_frames
+        self.count = 0              # 已进入窗口的帧数
+        self.valid_count = 0        # 窗口内有效帧数
+        self.fields = None          # shape: (n_frames, nct, 2)
+        self.valid = np.zeros(n_frames, dtype=bool)
+        self.sum = None             # 窗口内有效位移场之和, float64
+        self.latest = None          # 最新一帧（尚未进入窗口）
+        self.latest_valid = False
+        self._has_latest = False
+
+    def _allocate(self, nct):
+        self.fields = np.zeros((self.n_frames, nct, 2), dtype=np.float32)
+        self.sum = np.zeros((nct, 2), dtype=np.float64)
+        self.latest = np.zeros((nct, 2), dtype=np.float32)
+
+    def update(self, field, valid):
+        """写入新一帧的位移场，上一帧随之进入窗口"""
+        if self.fields is None:
+            self._allocate(len(field))
+
+        if self._has_latest:
+            self._push(self.latest, self.latest_valid)
+        self.latest[:] = field
+        self.latest_valid = valid
+        self._has_latest = True
+
+    def _push(self, field, valid):
+        i = self.count % self.n_frames
+        if self.count >= self.n_frames and self.valid[i]:
+            self.sum -= self.fields[i]
+            self.valid_count -= 1
+        self.fields[i] = field
+        self.valid[i] = valid
+        if valid:
+            self.sum += field
+            self.valid_count += 1
+        self.count += 1
+
+        if i == self.n_frames - 1:
+            # 每绕一圈重新求和一次，消除浮点累积误差
+            self.sum[:] = self.fields[self.valid].sum(axis=0)
+
+    @property
+    def ready(self):
+        """窗口是否已填满"""
+        return self.count >= self.n_frames
+
+    def mean(self):
+        """窗口内有效帧的平均位移场, shape: (nct, 2)；没有有效帧时返回 None"""
+        if self.valid_count == 0:
+            return None
+        return self.sum / self.valid_count
+
+    def count_deviations(self, threshold):
+        """
+        最新一帧中，位移偏离窗口均值超过 threshold 的点数（一次向量化计算）
+        :return: 点数；没有有效的历史帧时返回 None
+        """
+        mean = self.mean()
+        if mean is None:
+            return None
+        diff = self.latest - mean
+        return int(np.count_nonzero(np.einsum('ij,ij->i', diff, diff) > threshold * threshold))
+
+    def clear(self):
+        self.count = 0
+        self.valid_count = 0
+        self.valid[:] = False
+        self._has_latest = False
+        if self.sum is not None:
+            self.sum[:] = 0
@@ -0,0 +1,254 @@
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+
+
+def load_gs_config(config_path=None):
+    """
+    读取 GelSight 配置。
+    未指定路径时从命令行参数 --gs-config 中解析，未提供则使用默认配置。
+    """
+    from config import GSConfig
+
+    if config_path is None:
+        parser = argparse.ArgumentParser(
+            description="Run the Gelsight Mini Viewer with an optional config file."
+        )
+        parser.add_argument(
+            "--gs-config",
+            type=str,
+            default=None,
+            help="Path to the JSON configuration file. If not provided, default config is used.",
+        )
+        args, _ = parser.parse_known_args()
+        config_path = args.gs_config
+
+    return GSConfig(config_path).config
+
+
+class FrameSource:
+    """
+    图像帧来源的统一接口，与 GelSightMini 相机流保持一致：
+    start() 开始采集，update(dt) 返回一帧 RGB 图像（无图像时返回 None），stop() 结束采集。
+    """
+    live = False    # 是否为按自身帧率出帧的实时相机（只有实时相机可以用后台线程采集）
+
+    def start(self):
+        pass
+
+    def update(self, dt):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class LiveCameraSource(FrameSource):
+    """GelSight Mini 实时相机"""
+    live = True
+
+    def __init__(self, device_num, gs_config=None):
+        # 仅在使用实时相机时才加载相机驱动
+        from utilities.gelsightmini import GelSightMini
+
+        if gs_config is None:
+            gs_config = load_gs_config()
+
+        self.device_num = device_num
+        self.started = False
+        self.cam_stream = GelSightMini(
+            target_width=gs_config.camera_width,
+            target_height=gs_config.camera_height,
+            border_fraction=gs_config.border_fraction,
+        )
+
+    def start(self):
+        # 可能已由启动协调器提前打开，避免重复打开设备
+        if self.started:
+            return
+        self.cam_stream.select_device(self.device_num)
+        self.cam_stream.start()
+        self.started = True
+
+    def update(self, dt):
+        return self.cam_stream.update(dt)
+
+    def stop(self):
+        stop = getattr(self.cam_stream, 'stop', None)
+        if stop is not None:
+            stop()
+
+
+class ReplaySource(FrameSource):
+    """
+    回放录制的图像序列。
+
+    支持的文件格式:
+        .npy: 形状为 (T, H, W, 3) 的 uint8 数组，以内存映射方式读取
+        .npz: 包含 'frames' 数组（可选 'timestamps'，每帧的采集时刻，单位秒）
+        其他: 视频文件，由 cv2.VideoCapture 读取并转换为 RGB
+
+    realtime=True 时按录制的帧间隔回放（有 timestamps 时使用相邻帧的时间差，否则按 fps）；
+    realtime=False 时不等待，按 CPU 能达到的最快速度回放。
+    """
+    def __init__(self, path, realtime=False, loop=False, fps=30.0):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.fps = fps
+        self.frames = None
+        self.timestamps = None
+        self.video = None
+        self.index = 0
+        self._last_time = None
+
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.npy':
+            self.frames = np.load(path, mmap_mode='r')
+        elif ext == '.npz':
+            with np.load(path) as data:
+                self.frames = data['frames']
+                if 'timestamps' in data:
+                    self.timestamps = data['timestamps']
+        else:
+            self.video = cv2.VideoCapture(path)
+            if not self.video.isOpened():
+                raise IOError(f"无法打开视频文件: {path}")
+            self.fps = self.video.get(cv2.CAP_PROP_FPS) or fps
+
+    def __len__(self):
+        if self.frames is not None:
+            return len(self.frames)
+        return int(self.video.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def _read(self):
+        if self.frames is not None:
+            if self.index >= len(self.frames):
+                if not self.loop:
+                    return None
+                self.index = 0
+            frame = self.frames[self.index]
+        else:
+            ok, frame = self.video.read()
+            if not ok:
+                if not self.loop:
+                    return None
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, frame = self.video.read()
+                if not ok:
+                    return None
+                self.index = 0
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        self.index += 1
+        return frame
+
+    def frame_interval(self):
+        """下一帧与上一帧的录制间隔（秒）；没有录制时间戳或循环回到开头时按 fps"""
+        if self.timestamps is not None and 0 < self.index < len(self.timestamps):
+            interval = float(self.timestamps[self.index] - self.timestamps[self.index - 1])
+            if interval >= 0:
+                return interval
+        return 1.0 / self.fps
+
+    def update(self, dt):
+        if self.realtime:
+            # 按录制的帧间隔控制回放速度
+            now = time.time()
+            if self._last_time is not None:
+                wait = self.frame_interval() - (now - self._last_time)
+                if wait > 0:
+                    time.sleep(wait)
+            self._last_time = time.time()
+        return self._read()
+
+    def stop(self):
+        if self.video is not None:
+            self.video.release()
+
+
+class SyntheticMarkerSource(FrameSource):
+    """
+    合成的 GelSight 标记点图像，位移场已知，用于离线测试和性能评估。
+
+    motion 可选:
+        'static':  标记点保持不动
+        'shear_x': 沿x方向往复平移
+        'shear_y': 沿y方向往复平移
+        'slip_x':  沿x方向持续滑移
+        'rotate':  绕图像中心往复旋转
+        'random':  每个点独立随机抖动
+    """
+    MOTIONS = ('static', 'shear_x', 'shear_y', 'slip_x', 'rotate', 'random')
+
+    def __init__(self, width=320, height=240, rows=7, cols=9, motion='static',
+                 amplitude=3.0, period=60, marker_radius=5, noise=0.0, seed=0):
+        if motion not in self.MOTIONS:
+            raise ValueError(f"无效运动模式：{motion}")
+
+        self.width = width
+        self.height = height
+        self.rows = rows
+        self.cols = cols
+        self.motion = motion
+        self.amplitude = amplitude
+        self.period = period
+        self.marker_radius = marker_radius
+        self.noise = noise
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.index = 0
+
+        # 标记点均匀分布在图像中，保留一圈边距
+        margin_x = width / (cols + 1)
+        margin_y = height / (rows + 1)
+        xs = margin_x * np.arange(1, cols + 1)
+        ys = margin_y * np.arange(1, rows + 1)
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        self.origin = np.stack([grid_x.ravel(), grid_y.ravel()], axis=1).astype(np.float32)
+
+    @property
+    def marker_centers(self):
+        """初始标记点中心, 与 MarkerTracker.initial_marker_center 一致, 每行为 (y, x)"""
+        return self.origin[:, ::-1].copy()
+
+    def true_field(self, index):
+        """第 index 帧的真实位移场, shape: (nct, 2)"""
+        phase = np.sin(2 * np.pi * index / self.period)
+        field = np.zeros_like(self.origin)
+        if self.motion == 'shear_x':
+            field[:, 0] = self.amplitude * phase
+        elif self.motion == 'shear_y':
+            field[:, 1] = self.amplitude * phase
+        elif self.motion == 'slip_x':
+            field[:, 0] = self.amplitude * index / self.period
+        elif self.motion == 'rotate':
+            center = np.array([self.width / 2, self.height / 2], dtype=np.float32)
+            angle = np.deg2rad(self.amplitude) * phase
+            c, s = np.cos(angle), np.sin(angle)
+            rel = self.origin - center
+            field[:, 0] = c * rel[:, 0] - s * rel[:, 1] - rel[:, 0]
+            field[:, 1] = s * rel[:, 0] + c * rel[:, 1] - rel[:, 1]
+        elif self.motion == 'random':
+            rng = np.random.default_rng((self.seed, index))
+            field = rng.normal(0, self.amplitude / 3, self.origin.shape).astype(np.float32)
+        return field
+
+    def render(self, field):
+        """按给定位移场绘制一帧图像"""
+        img = np.full((self.height, self.width, 3), 200, dtype=np.uint8)
+        # 以1/16像素精度绘制（shift=4），支持亚像素位移
+        points = np.round((self.origin + field) * 16).astype(np.int32)
+        radius = int(round(self.marker_radius * 16))
+        for x, y in points:
+            cv2.circle(img, (int(x), int(y)), radius, (30, 30, 30), -1, cv2.LINE_AA, shift=4)
+        if self.noise > 0:
+            noise = self.rng.normal(0, self.noise, img.shape)
+            img = np.clip(img + noise, 0, 255).astype(np.uint8)
+        return img
+
+    def update(self, dt):
+        frame = self.render(self.true_field(self.index))
+        self.index += 1
+        return frame
@@ -1,320 +1,581 @@
-from utilities.gelsightmini import GelSightMini
 import cv2
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from utilities.marker_tracker import MarkerTracker
-import argparse
-from config import GSConfig
+from frame_source import LiveCameraSource
 import matplotlib.pyplot as plt
 import os
+import time
+from capture import StereoCapture
+from collections import deque
+
+
+class DisplacementRecord:
+    """
+    单帧的标记点位移记录。
+    由 DisplacementTracker.track 每帧计算一次，供各个检测器共享读取，
+    避免对同一帧重复运行光流。
+    """
+    def __init__(self, points, field, status, valid, timestamp=None, magnitude=None):
+        self.points = points            # 当前标记点位置, shape: (nct, 2)
+        self.field = field              # 每个点的位移向量, shape: (nct, 2)
+        self.dx = field[:, 0]           # 每个点x方向位移, shape: (nct,)
+        self.dy = field[:, 1]           # 每个点y方向位移, shape: (nct,)
+        self.status = status            # 每个点是否追踪成功, shape: (nct,)
+        self.valid = valid              # 是否全部标记点都追踪成功（部分追踪模式下为有效点是否足够）
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+        # 总位移（欧几里得距离）
+        self.magnitude = np.hypot(self.dx, self.dy) if magnitude is None else magnitude
+
+        # 追踪失败时平均位移记为0，与原有接口保持一致
+        if valid and status.all():
+            mean_d = field.mean(axis=0)
+            self.mean_dx = float(mean_d[0])
+            self.mean_dy = float(mean_d[1])
+            self.mean_total = float(self.magnitude.mean())
+        elif valid:
+            # 部分标记点丢失时只统计追踪成功的点
+            mean_d = field[status].mean(axis=0)
+            self.mean_dx = float(mean_d[0])
+            self.mean_dy = float(mean_d[1])
+            self.mean_total = float(self.magnitude[status].mean())
+        else:
+            self.mean_dx = 0.0
+            self.mean_dy = 0.0
+            self.mean_total = 0.0
+
 
 class DisplacementTracker:
-    def __init__(self, device_num):
+    PREDICTORS = ('constant_velocity', 'kalman')
+
+    # 运动预测模式下按上一帧预测误差（像素）选择金字塔层数和迭代次数:
+    # (预测误差上限, maxLevel, 最大迭代次数)
+    PREDICTION_LK_LEVELS = (
+        (0.5, 1, 5),                # 基本静止
+        (3.0, 2, 10),               # 与默认参数相同
+        (float('inf'), 3, 20),      # 快速滑移
+    )
+
+    # 匀速模型卡尔曼滤波的稳态增益（alpha-beta 滤波）
+    KALMAN_ALPHA = 0.9
+    KALMAN_BETA = 0.5
+
+    # Lucas-Kanade光流参数
+    LK_PARAMS = dict(
+        winSize=(15, 15),
+        maxLevel=2,
+        criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+    )
+
+    # 初始化缓存的格式版本，以及校验缓存时允许的最大标记点偏移（像素）
+    INIT_CACHE_VERSION = 1
+    INIT_CACHE_MAX_SHIFT = 2.0
+
+    # 部分追踪模式：有效标记点少于该比例时整帧视为追踪失败
+    MIN_VALID_FRACTION = 0.5
+    # 重新捕获丢失标记点时，搜索区域内的最小灰度对比度
+    REACQUIRE_MIN_CONTRAST = 30
+
+    # update_marker_view 保存的位移历史帧数（约 30 秒），完整的运行记录见 session_recorder
+    HISTORY_LENGTH = 1000
+
+    def __init__(self, device_num=None, source=None, buffer_pool=False, predictor=None,
+                 partial_tracking=False, gs_config=None):
+        """
+        :param device_num: 实时相机的设备号
+        :param source: 自定义图像来源（FrameSource），例如 ReplaySource 或 SyntheticMarkerSource；
+                       未提供时使用 device_num 对应的实时相机
+        :param buffer_pool: 是否复用预分配的灰度图、追踪点和位移缓冲区。
+                            开启后 track() 返回的记录中的数组会在下一帧被覆盖，需要保留时请自行拷贝
+        :param predictor: 标记点运动预测方式，None（从上一帧位置开始追踪）、
+                          'constant_velocity'（匀速外推）或 'kalman'（匀速模型的稳态卡尔曼滤波）。
+                          预测位置作为LK的初始值（OPTFLOW_USE_INITIAL_FLOW），
+                          并根据预测误差自适应调整金字塔层数和迭代次数
+        :param partial_tracking: 是否允许部分标记点丢失。开启后只要有效点不少于 MIN_VALID_FRACTION
+                                 就继续追踪，统计量只使用有效点，丢失的点在预期网格位置附近重新捕获
+        :param gs_config: 已加载的 GelSight 配置，未提供时由实时相机自行读取
+        """
+        if predictor is not None and predictor not in self.PREDICTORS:
+            raise ValueError(f"无效预测方式：{predictor}")
+
         self.markertracker = None
         self.Ox = None
         self.Oy = None
+        self.origin = None      # 初始标记点位置, shape: (nct, 2), float32
         self.nct = 0
         self.old_gray = None
         self.lk_params = None
         self.p0 = None
         self.initialized = False
 
-        # 初始化相机
-        parser = argparse.ArgumentParser(
-        description="Run the Gelsight Mini Viewer with an optional config file."
-    )
-        parser.add_argument(
-            "--gs-config",
-            type=str,
-            default=None,
-            help="Path to the JSON configuration file. If not provided, default config is used.",
-        )
-
-        args = parser.parse_args()
-
-        gs_config = GSConfig(args.gs_config).config
+        # 预分配缓冲区（buffer_pool 模式）
+        self.buffer_pool = buffer_pool
+        self._gray_bufs = None      # 两块灰度图缓冲区交替使用
+        self._gray_index = 0
+        self._p1_buf = None
+        self._st_buf = None
+        self._err_buf = None
+        self._status_buf = None
+        self._field_buf = None
+        self._mag_buf = None
+
+        # 运动预测状态
+        self.predictor = predictor
+        self._motion_pos = None     # 运动模型估计的标记点位置, shape: (nct, 2)
+        self._velocity = None       # 每帧位移速度, shape: (nct, 2)
+        self._residual = None
+        self._prediction_error = 1.0    # 上一帧的最大预测误差（像素）
+        self._predicted_lk_params = None
+
+        # 部分追踪状态
+        self.partial_tracking = partial_tracking
+        self.min_valid = 0              # 视为有效帧所需的最少标记点数
+        self.reacquire_radius = 0       # 重新捕获的搜索半径（像素）
 
         # 初始化相机流
-        self.cam_stream = GelSightMini(
-            target_width=gs_config.camera_width,
-            target_height=gs_config.camera_height,
-            border_fraction=gs_config.border_fraction,
-        )
-        self.cam_stream.select_device(device_num)  # 选择设备0
+        if source is None:
+            source = LiveCameraSource(device_num, gs_config)
+        self.cam_stream = source
         self.cam_stream.start()
         
-        # 存储位移历史数据
-        self.displacement_history = []
+        # 存储位移历史数据（只保留最近 HISTORY_LENGTH 帧，长时间运行时内存占用不再增长）
+        self.displacement_history = deque(maxlen=self.HISTORY_LENGTH)
+        self.history_count = 0      # 累计记录的帧数
         self.current_displacements = None
+        self.last_record = None
+        self.tracer = None      # 可选的 instrumentation.Tracer，记录灰度转换和光流耗时
+
+    def initialize(self, frame: np.ndarray, marker_centers=None, cache_path=None):
+        """
+        :param frame: 第一帧图像
+        :param marker_centers: 已知的初始标记点中心 (nct, 2)，每行为 (y, x)；
+                               未提供时由 MarkerTracker 检测
+        :param cache_path: 初始化缓存文件（.npz）。未提供 marker_centers 时先尝试从缓存恢复，
+                           校验失败才由 MarkerTracker 重新检测，并将检测结果写回缓存
+        """
+        detected = marker_centers is None
+        if detected and cache_path is not None and self.load_initialization(cache_path, frame):
+            return
 
-    def initialize(self, frame: np.ndarray):
-        # 将帧转换为浮点数格式
-        img = np.float32(frame) / 255.0
-        
-        # 创建MarkerTracker实例
-        self.markertracker = MarkerTracker(img)
-        
-        # 获取初始标记点中心
-        marker_centers = self.markertracker.initial_marker_center
+        if marker_centers is None:
+            # 将帧转换为浮点数格式
+            img = np.float32(frame) / 255.0
+
+            # 创建MarkerTracker实例
+            self.markertracker = MarkerTracker(img)
+
+            # 获取初始标记点中心
+            marker_centers = self.markertracker.initial_marker_center
         self.Ox = marker_centers[:, 1]  # x坐标
         self.Oy = marker_centers[:, 0]  # y坐标
         self.nct = len(marker_centers)  # 标记点数量
         
+        if self.buffer_pool:
+            self.allocate_buffers(frame.shape[:2])
+
         # 转换为灰度图像用于光流追踪
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        frame_gray = self.to_gray(frame)
         self.old_gray = frame_gray
         
         # Lucas-Kanade光流参数
-        self.lk_params = dict(
-            winSize=(15, 15),
-            maxLevel=2,
-            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
-        )
+        self.lk_params = dict(self.LK_PARAMS)
         
         # 准备追踪点
-        self.p0 = np.array([[self.Ox[0], self.Oy[0]]], np.float32).reshape(-1, 1, 2)
-        for i in range(self.nct - 1):
-            new_point = np.array([[self.Ox[i + 1], self.Oy[i + 1]]], np.float32).reshape(-1, 1, 2)
-            self.p0 = np.append(self.p0, new_point, axis=0)
+        self.origin = np.stack([self.Ox, self.Oy], axis=1).astype(np.float32)
+        self.p0 = self.origin.reshape(-1, 1, 2).copy()
+
+        if self.predictor is not None:
+            self.reset_motion_model()
+
+        # 部分追踪：搜索半径取相邻标记点间距的一半，避免捕获到相邻的点
+        self.min_valid = self.nct
+        if self.partial_tracking:
+            self.min_valid = max(1, int(np.ceil(self.nct * self.MIN_VALID_FRACTION)))
+            diff = self.origin[:, None, :] - self.origin[None, :, :]
+            dist = np.hypot(diff[..., 0], diff[..., 1])
+            np.fill_diagonal(dist, np.inf)
+            spacing = float(np.median(dist.min(axis=1))) if self.nct > 1 else 20.0
+            self.reacquire_radius = max(3, int(spacing / 2))
         
         self.initialized = True
         print(f"初始化完成，检测到 {self.nct} 个标记点")
 
+        if detected and cache_path is not None:
+            self.save_initialization(cache_path)
+
+    def save_initialization(self, path):
+        """
+        保存初始化结果（按标记点顺序排列的初始中心和参考灰度图），供下次启动时快速恢复。
+        先写入临时文件再替换，进程中途退出不会留下损坏的缓存
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     version=self.INIT_CACHE_VERSION,
+                     marker_centers=np.stack([self.Oy, self.Ox], axis=1).astype(np.float32),
+                     reference_gray=self.old_gray)
+        os.replace(tmp_path, path)
+
+    def load_initialization(self, path, frame: np.ndarray):
+        """
+        读取保存的初始化结果并用当前帧校验：从参考灰度图到当前帧的光流全部追踪成功，
+        且标记点偏移不超过 INIT_CACHE_MAX_SHIFT 时，以追踪到的位置作为初始标记点完成初始化
+        :return: 是否从缓存恢复成功
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != self.INIT_CACHE_VERSION:
+                    return False
+                marker_centers = data['marker_centers']
+                reference_gray = data['reference_gray']
+        except Exception as e:
+            # 缓存文件损坏（截断、格式错误等）时回退到标记点检测，不影响启动
+            print(f"读取初始化缓存失败: {e!r}")
+            return False
+
+        if marker_centers.ndim != 2 or marker_centers.shape[1] != 2 or len(marker_centers) == 0:
+            print("初始化缓存中的标记点格式错误，重新检测标记点")
+            return False
+        if reference_gray.dtype != np.uint8 or reference_gray.shape != frame.shape[:2]:
+            return False
+
+        # 传感器状态与保存时一致（无接触、未移位）时，所有标记点只有微小偏移
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        p0 = np.ascontiguousarray(marker_centers[:, ::-1], dtype=np.float32).reshape(-1, 1, 2)
+        p1, st, _ = cv2.calcOpticalFlowPyrLK(reference_gray, frame_gray, p0, None, **self.LK_PARAMS)
+        if not st.all():
+            return False
+        shift = (p1 - p0).reshape(-1, 2)
+        if np.hypot(shift[:, 0], shift[:, 1]).max() > self.INIT_CACHE_MAX_SHIFT:
+            print("初始化缓存与当前图像不一致，重新检测标记点")
+            return False
+
+        self.initialize(frame, p1.reshape(-1, 2)[:, ::-1])
+        print(f"已从缓存恢复初始化: {path}")
+        return True
+
+    def allocate_buffers(self, frame_shape):
+        """为 buffer_pool 模式预分配每帧复用的缓冲区"""
+        self._gray_bufs = [np.empty(frame_shape, dtype=np.uint8) for _ in range(2)]
+        self._gray_index = 0
+        self._p1_buf = np.empty((self.nct, 1, 2), dtype=np.float32)
+        self._st_buf = np.empty((self.nct, 1), dtype=np.uint8)
+        self._err_buf = np.empty((self.nct, 1), dtype=np.float32)
+        self._status_buf = np.empty(self.nct, dtype=bool)
+        self._field_buf = np.empty((self.nct, 2), dtype=np.float32)
+        self._mag_buf = np.empty(self.nct, dtype=np.float32)
+
+    def reset_motion_model(self):
+        """重置运动预测状态：速度清零，位置取当前追踪点"""
+        self._motion_pos = self.p0.reshape(-1, 2).copy()
+        self._velocity = np.zeros((self.nct, 2), dtype=np.float32)
+        self._residual = np.zeros((self.nct, 2), dtype=np.float32)
+        self._prediction_error = 1.0
+        self._predicted_lk_params = [
+            (limit, dict(
+                winSize=self.lk_params['winSize'],
+                maxLevel=max_level,
+                criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, iterations, 0.03),
+                flags=cv2.OPTFLOW_USE_INITIAL_FLOW,
+            ))
+            for limit, max_level, iterations in self.PREDICTION_LK_LEVELS
+        ]
+
+    def predict_points(self):
+        """
+        按运动模型预测本帧标记点位置
+        :return: (预测位置 (nct, 1, 2), 对应的光流参数)
+        """
+        if self.buffer_pool:
+            predicted = self._p1_buf
+        else:
+            predicted = np.empty_like(self.p0)
+        np.add(self._motion_pos, self._velocity, out=predicted.reshape(-1, 2))
+
+        for limit, lk_params in self._predicted_lk_params:
+            if self._prediction_error < limit:
+                break
+        return predicted, lk_params
+
+    def update_motion_model(self, current_points, valid):
+        """用本帧追踪结果更新运动模型"""
+        if not valid:
+            # 追踪点未更新，速度清零并在下一帧使用最大搜索范围
+            np.copyto(self._motion_pos, self.p0.reshape(-1, 2))
+            self._velocity[:] = 0
+            self._prediction_error = float('inf')
+            return
+
+        # 预测误差 = 实测位置 - 预测位置
+        np.add(self._motion_pos, self._velocity, out=self._residual)
+        np.subtract(current_points, self._residual, out=self._residual)
+        self._prediction_error = float(np.abs(self._residual).max())
+
+        if self.predictor == 'constant_velocity':
+            np.subtract(current_points, self._motion_pos, out=self._velocity)
+            np.copyto(self._motion_pos, current_points)
+        else:
+            self._motion_pos += self._velocity
+            self._motion_pos += self.KALMAN_ALPHA * self._residual
+            self._velocity += self.KALMAN_BETA * self._residual
+
+    def reacquire_markers(self, frame_gray, current_points, status):
+        """
+        在预期位置附近重新捕获丢失的标记点（原地修改 current_points 和 status）。
+        预期位置 = 初始位置 + 有效点的中位位移；在该位置周围的小区域内取最接近中心的暗斑质心，
+        未能捕获的点放在预期位置，下一帧继续尝试
+        """
+        lost = np.flatnonzero(~status)
+        offset = np.median(current_points[status] - self.origin[status], axis=0)
+        expected = self.origin[lost] + offset
+
+        r = self.reacquire_radius
+        h, w = frame_gray.shape[:2]
+        for i, (x, y) in zip(lost, expected):
+            current_points[i] = (x, y)
+            x0 = int(round(x)) - r
+            y0 = int(round(y)) - r
+            if x0 < 0 or y0 < 0 or x0 + 2 * r + 1 > w or y0 + 2 * r + 1 > h:
+                continue
+
+            patch = frame_gray[y0:y0 + 2 * r + 1, x0:x0 + 2 * r + 1]
+            lo, hi = int(patch.min()), int(patch.max())
+            if hi - lo < self.REACQUIRE_MIN_CONTRAST:
+                continue
+
+            # 标记点为暗斑：阈值取搜索区域灰度范围的中点
+            threshold = (lo + hi) // 2
+            mask = (patch < threshold).astype(np.uint8)
+            n, labels, stats, centroids = cv2.connectedComponentsWithStats(mask)
+            if n < 2:
+                continue
+            # 跳过背景（标签0），选择质心最接近搜索中心的暗斑
+            d = np.hypot(centroids[1:, 0] - r, centroids[1:, 1] - r)
+            k = int(np.argmin(d)) + 1
+            if d[k - 1] > r or stats[k, cv2.CC_STAT_AREA] < 4:
+                continue
+
+            # 以暗度加权求亚像素质心
+            weight = np.where(labels == k, threshold - patch.astype(np.float32), 0)
+            m = cv2.moments(weight)
+            current_points[i] = (x0 + m['m10'] / m['m00'], y0 + m['m01'] / m['m00'])
+            status[i] = True
+
+    def to_gray(self, frame: np.ndarray):
+        """转换为灰度图；buffer_pool 模式下写入两块缓冲区中当前未被参考帧占用的那一块"""
+        if not self.buffer_pool:
+            return cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY, dst=self._gray_bufs[self._gray_index])
+        self._gray_index ^= 1
+        return frame_gray
+
     def calculate_displacements(self, current_points: np.ndarray):
         """计算每个标记点的位移"""
         if not self.initialized or len(current_points) != self.nct:
             return None
         
         # 计算每个点相对于初始位置的位移
-        displacements = []
-        for i in range(len(current_points)):
-            dx = current_points[i][0] - self.Ox[i]
-            dy = current_points[i][1] - self.Oy[i]
-            displacement = np.sqrt(dx**2 + dy**2)
-            displacements.append(displacement)
-        
-        return np.array(displacements)
+        field = self.calculate_displacement_field(current_points)
+        return np.hypot(field[:, 0], field[:, 1])
+
+    def calculate_displacement_field(self, current_points: np.ndarray):
+        """计算每个标记点相对于初始位置的位移向量, shape: (nct, 2)"""
+        if not self.initialized or len(current_points) != self.nct:
+            return None
+
+        return np.subtract(current_points.reshape(-1, 2), self.origin, dtype=np.float32)
+
+    def track(self, frame: np.ndarray, timestamp=None):
+        """
+        对新帧执行一次光流追踪，返回该帧的位移记录。
+        每帧只应调用一次，所有检测器共享返回的 DisplacementRecord。
+        """
+        if not self.initialized:
+            return None
+
+        tracer = self.tracer
+        if tracer is not None and tracer.enabled:
+            start = time.perf_counter_ns()
+            frame_gray = self.to_gray(frame)
+            tracer.record_since('gray', start)
+            start = time.perf_counter_ns()
+            current_points, status, valid = self.track_gray(frame_gray)
+            tracer.record_since('lk', start)
+        else:
+            frame_gray = self.to_gray(frame)
+            current_points, status, valid = self.track_gray(frame_gray)
+        return self.make_record(current_points, status, valid, timestamp)
+
+    def make_record(self, current_points, status, valid, timestamp=None):
+        """由本帧追踪结果生成位移记录，并保存为 last_record"""
+        if self.buffer_pool:
+            field = np.subtract(current_points, self.origin, out=self._field_buf)
+            magnitude = np.hypot(field[:, 0], field[:, 1], out=self._mag_buf)
+        else:
+            field = self.calculate_displacement_field(current_points)
+            magnitude = None
+
+        self.last_record = DisplacementRecord(current_points, field, status, valid, timestamp, magnitude)
+        return self.last_record
+
+    def track_gray(self, frame_gray):
+        """
+        对灰度帧执行光流追踪并更新追踪状态
+        :return: (当前标记点位置 (nct, 2), 每个点是否追踪成功 (nct,), 本帧是否有效)
+        """
+        # 运动预测：以预测位置作为光流初始值
+        next_pts, lk_params = self._p1_buf, self.lk_params
+        if self.predictor is not None:
+            next_pts, lk_params = self.predict_points()
 
-    def get_average_displacement(self, frame: np.ndarray):
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        
         # 使用Lucas-Kanade光流追踪
         p1, st, err = cv2.calcOpticalFlowPyrLK(
-            self.old_gray, frame_gray, self.p0, None, **self.lk_params
+            self.old_gray, frame_gray, self.p0, next_pts, self._st_buf, self._err_buf,
+            **lk_params
         )
-        
-        # 选择成功追踪的点
-        good_new = p1[st == 1]
-        good_old = self.p0[st == 1]
-        
-        avg_disp = 0.0
-        # 更新追踪点
-        if len(good_new) >= self.nct:
-            self.p0 = good_new.reshape(-1, 1, 2)
-            
-            # 计算位移
-            current_points = good_new.reshape(-1, 2)
-            current_displacements = self.calculate_displacements(current_points)
-            avg_disp = np.mean(current_displacements)
-
-        # 更新灰度图像
-        self.old_gray = frame_gray.copy()
-        
-        return avg_disp
-    
+
+        # 预测位置偏差过大导致追踪丢失时，退回从上一帧位置开始的常规追踪
+        if self.predictor is not None and int(np.count_nonzero(st)) < self.nct:
+            p1, st, err = cv2.calcOpticalFlowPyrLK(
+                self.old_gray, frame_gray, self.p0, self._p1_buf, self._st_buf, self._err_buf,
+                **self.lk_params
+            )
+
+        return self.update_points(frame_gray, p1, st)
+
+    def update_points(self, frame_gray, p1, st):
+        """
+        根据光流结果更新追踪状态（追踪点、运动模型、参考帧）
+        :param frame_gray: 本帧灰度图，作为下一帧的参考图像
+        :param p1: 光流输出的标记点位置 (nct, 1, 2)
+        :param st: 光流输出的追踪状态 (nct, 1)
+        :return: (当前标记点位置 (nct, 2), 每个点是否追踪成功 (nct,), 本帧是否有效)
+        """
+        if self.buffer_pool:
+            status = np.equal(st.reshape(-1), 1, out=self._status_buf)
+        else:
+            status = st.reshape(-1) == 1
+        current_points = p1.reshape(-1, 2)
+        # 只有全部标记点都追踪成功时才更新追踪点（部分追踪模式下有效点足够即可）
+        n_valid = int(np.count_nonzero(status))
+        if self.partial_tracking and self.min_valid <= n_valid < self.nct:
+            self.reacquire_markers(frame_gray, current_points, status)
+        valid = n_valid >= self.min_valid
+        if self.predictor is not None:
+            self.update_motion_model(current_points, valid)
+        if valid:
+            if self.buffer_pool:
+                np.copyto(self.p0, p1)
+            else:
+                self.p0 = p1.reshape(-1, 1, 2)
+
+        # 本帧灰度图直接作为下一帧的参考图像，无需拷贝
+        # （buffer_pool 模式下两块缓冲区交替写入，参考帧不会被覆盖）
+        self.old_gray = frame_gray
+        return current_points, status, valid
+
+    def process_sequence(self, frames, chunk_size=64, threads=4, out=None, status_out=None,
+                         marker_centers=None):
+        """
+        批量处理一段录制的图像序列，返回每帧的位移场和追踪状态。
+        灰度转换按块提交到线程池并行执行（OpenCV 运算期间释放 GIL），
+        处理当前块的同时预先转换下一块；光流追踪依赖上一帧结果，按顺序执行。
+
+        :param frames: 形状为 (T, H, W, 3) 的数组或内存映射（例如 np.load(path, mmap_mode='r')）
+        :param chunk_size: 每块的帧数，同时在内存中的灰度图最多为两块
+        :param threads: 灰度转换的线程数
+        :param out: 可选的输出位移场数组 (T, nct, 2) float32，可以是 np.memmap
+        :param status_out: 可选的输出追踪状态数组 (T, nct) bool
+        :param marker_centers: 追踪器尚未初始化时，用 frames[0] 和该标记点中心初始化
+        :return: (位移场 (T, nct, 2), 追踪状态 (T, nct))，每帧相对初始标记点位置
+        """
+        if not self.initialized:
+            self.initialize(np.asarray(frames[0]), marker_centers)
+
+        n = len(frames)
+        fields = out if out is not None else np.empty((n, self.nct, 2), dtype=np.float32)
+        status = status_out if status_out is not None else np.empty((n, self.nct), dtype=bool)
+
+        def to_gray(i):
+            return cv2.cvtColor(np.asarray(frames[i]), cv2.COLOR_RGB2GRAY)
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            def submit_chunk(start):
+                return [pool.submit(to_gray, i) for i in range(start, min(start + chunk_size, n))]
+
+            pending = submit_chunk(0)
+            for start in range(0, n, chunk_size):
+                chunk, pending = pending, submit_chunk(start + chunk_size)
+                for i, future in enumerate(chunk, start):
+                    current_points, st, _ = self.track_gray(future.result())
+                    np.subtract(current_points, self.origin, out=fields[i])
+                    status[i] = st
+
+        return fields, status
+
+    def get_average_displacement(self, frame: np.ndarray):
+        return self.track(frame).mean_total
+
     def calculate_directional_displacements(self, current_points: np.ndarray):
         """计算每个标记点在x和y方向的位移"""
         if not self.initialized or len(current_points) != self.nct:
             return None, None
         
         # 计算每个点相对于初始位置的x和y方向位移
-        dx_list = []
-        dy_list = []
-        
-        for i in range(len(current_points)):
-            dx = current_points[i][0] - self.Ox[i]  # x方向位移
-            dy = current_points[i][1] - self.Oy[i]  # y方向位移
-            dx_list.append(dx)
-            dy_list.append(dy)
-        
-        return np.array(dx_list), np.array(dy_list)
+        field = self.calculate_displacement_field(current_points)
+        return field[:, 0], field[:, 1]
     
     def get_directional_displacement_every_point(self, frame: np.ndarray):
         """获取每个点的x和y方向的位移"""
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        
-        # 使用Lucas-Kanade光流追踪
-        p1, st, err = cv2.calcOpticalFlowPyrLK(
-            self.old_gray, frame_gray, self.p0, None, **self.lk_params
-        )
-        
-        # 选择成功追踪的点
-        good_new = p1[st == 1]
-        good_old = self.p0[st == 1]
-        
-        dx_displacements_list = []
-        dy_displacements_list = []
-        
-        # 更新追踪点
-        if len(good_new) >= self.nct:
-            self.p0 = good_new.reshape(-1, 1, 2)
-            
-            # 计算方向性位移
-            current_points = good_new.reshape(-1, 2)
-            dx_displacements, dy_displacements = self.calculate_directional_displacements(current_points)
-            if dx_displacements is not None and dy_displacements is not None:
-                dx_displacements_list.append(dx_displacements)
-                dy_displacements_list.append(dy_displacements)
-        
-        # 更新灰度图像
-        self.old_gray = frame_gray.copy()
-        
-        return dx_displacements_list, dy_displacements_list
-
+        record = self.track(frame)
+        if not record.valid:
+            return [], []
+        return [record.dx], [record.dy]
 
     def get_average_directional_displacement(self, frame: np.ndarray):
         """获取x和y方向的平均位移"""
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        
-        # 使用Lucas-Kanade光流追踪
-        p1, st, err = cv2.calcOpticalFlowPyrLK(
-            self.old_gray, frame_gray, self.p0, None, **self.lk_params
-        )
-        
-        # 选择成功追踪的点
-        good_new = p1[st == 1]
-        good_old = self.p0[st == 1]
-        
-        avg_dx = 0.0
-        avg_dy = 0.0
-        
-        # 更新追踪点
-        if len(good_new) >= self.nct:
-            self.p0 = good_new.reshape(-1, 1, 2)
-            
-            # 计算方向性位移
-            current_points = good_new.reshape(-1, 2)
-            dx_displacements, dy_displacements = self.calculate_directional_displacements(current_points)
-            
-            if dx_displacements is not None and dy_displacements is not None:
-                avg_dx = np.mean(dx_displacements)  # x方向平均位移
-                avg_dy = np.mean(dy_displacements)  # y方向平均位移
-
-        # 更新灰度图像
-        self.old_gray = frame_gray.copy()
-        
-        return avg_dx, avg_dy
+        record = self.track(frame)
+        return record.mean_dx, record.mean_dy
 
     def update_marker_view(self, frame: np.ndarray):
         if not self.initialized:
             return None
-            
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        
-        # 使用Lucas-Kanade光流追踪
-        p1, st, err = cv2.calcOpticalFlowPyrLK(
-            self.old_gray, frame_gray, self.p0, None, **self.lk_params
-        )
-        
-        # 选择成功追踪的点
-        good_new = p1[st == 1]
-        good_old = self.p0[st == 1]
-        
-        # 更新追踪点
-        if len(good_new) >= self.nct:
-            self.p0 = good_new.reshape(-1, 1, 2)
-            
-            # 计算位移
-            current_points = good_new.reshape(-1, 2)
-            self.current_displacements = self.calculate_displacements(current_points)
-            
-            if self.current_displacements is not None:
-                # 保存位移历史
-                self.displacement_history.append(self.current_displacements.copy())
-                
-                # 打印当前帧的位移统计
-                self.print_displacement_stats(frame_count=len(self.displacement_history))
-        
-        # 更新灰度图像
-        self.old_gray = frame_gray.copy()
-        return good_new  # 返回当前标记点位置
 
+        record = self.track(frame)
+        if record.valid:
+            self.current_displacements = record.magnitude
+
+            # 保存位移历史
+            self.displacement_history.append(self.current_displacements.copy())
+            self.history_count += 1
+
+            # 打印当前帧的位移统计
+            self.print_displacement_stats(frame_count=self.history_count)
+
+        return record.points[record.status]  # 返回当前标记点位置
 
     def get_comprehensive_displacement(self, frame: np.ndarray):
         """获取x、y方向平均位移以及总平均位移"""
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        
-        # 使用Lucas-Kanade光流追踪
-        p1, st, err = cv2.calcOpticalFlowPyrLK(
-            self.old_gray, frame_gray, self.p0, None, **self.lk_params
-        )
-        
-        # 选择成功追踪的点
-        good_new = p1[st == 1]
-        good_old = self.p0[st == 1]
-        
-        avg_dx = 0.0
-        avg_dy = 0.0
-        avg_total = 0.0
-        
-        # 更新追踪点
-        if len(good_new) >= self.nct:
-            self.p0 = good_new.reshape(-1, 1, 2)
-            
-            # 计算位移
-            current_points = good_new.reshape(-1, 2)
-            dx_displacements, dy_displacements = self.calculate_directional_displacements(current_points)
-            
-            if dx_displacements is not None and dy_displacements is not None:
-                avg_dx = np.mean(dx_displacements)  # x方向平均位移
-                avg_dy = np.mean(dy_displacements)  # y方向平均位移
-                
-                # 计算总位移（欧几里得距离）
-                total_displacements = np.sqrt(dx_displacements**2 + dy_displacements**2)
-                avg_total = np.mean(total_displacements)
+        record = self.track(frame)
+        return record.mean_dx, record.mean_dy, record.mean_total
 
-        # 更新灰度图像
-        self.old_gray = frame_gray.copy()
-        
-        return avg_dx, avg_dy, avg_total
-
-    
     def get_displacement_field(self, frame: np.ndarray):
         if not self.initialized:
             return None
-            
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
-        
-        # 使用Lucas-Kanade光流追踪
-        p1, st, err = cv2.calcOpticalFlowPyrLK(
-            self.old_gray, frame_gray, self.p0, None, **self.lk_params
-        )
-        
-        # 选择成功追踪的点
-        good_new = p1[st == 1]
-        good_old = self.p0[st == 1]
-        
-        displacements = np.zeros((7, 9, 2), dtype=np.float32)
-        # 更新追踪点
-        if len(good_new) >= self.nct:
-            self.p0 = good_new.reshape(-1, 1, 2)
-            
-            # 计算位移
-            current_points = good_new.reshape(-1, 2)
-            if len(current_points) != self.nct:
-                print(f'Warning: (current_points) != self.nct')
-                return None
-            
-            # 计算每个点的位移向量
-            displacements = np.stack([
-                current_points[:, 0] - self.Ox,
-                current_points[:, 1] - self.Oy
-            ], axis=1)  # shape: (nct, 2)
-            displacements.reshape((7, 9, 2))
-        
-        # 更新灰度图像
-        self.old_gray = frame_gray.copy()
 
-        return displacements
+        record = self.track(frame)
+        if not record.valid:
+            return np.zeros((7, 9, 2), dtype=np.float32)
+
+        # 每个点的位移向量, shape: (nct, 2)
+        return record.field
 
     def print_displacement_stats(self, frame_count: int):
         """打印位移统计信息"""
@@ -345,7 +606,7 @@ class DisplacementTracker:
         print(f"总体最大位移: {overall_max:.2f}px")
         print(f"总体最小位移: {overall_min:.2f}px")
         print(f"总体平均位移: {overall_avg:.2f}px")
-        print(f"总帧数: {len(self.displacement_history)}")
+        print(f"总帧数: {self.history_count}（统计最近 {len(self.displacement_history)} 帧）")
         print(f"标记点数量: {self.nct}")
 
     def show_displacement_field(self, displacement_field, frame_idx):
@@ -384,29 +645,116 @@ class DisplacementTracker:
 
 
 
+class StereoLKTracker:
+    """
+    左右传感器合并的光流追踪。
+    两路灰度图并排拼接到同一张图像中（中间留出保护带），右侧标记点的x坐标加上偏移量后
+    与左侧标记点合并，每帧只调用一次 calcOpticalFlowPyrLK，再将结果拆分回各自的追踪器，
+    减少一次 Python/OpenCV 调用和金字塔构建的开销。
+
+    保护带宽度不小于 winSize * 2^maxLevel，最粗一层金字塔上的搜索窗口也不会跨到另一路图像。
+    追踪器的运动预测会为每路选择不同的光流参数，因此合并模式不支持 predictor。
+    """
+    GUARD_VALUE = 0     # 保护带的填充灰度值
+
+    def __init__(self, tracker_l, tracker_r):
+        """
+        :param tracker_l, tracker_r: 已初始化的左右 DisplacementTracker（灰度图尺寸可以不同）
+        """
+        if tracker_l.predictor is not None or tracker_r.predictor is not None:
+            raise ValueError("合并光流追踪不支持运动预测（predictor）")
+        self.tracker_l = tracker_l
+        self.tracker_r = tracker_r
+
+        h_l, w_l = tracker_l.old_gray.shape[:2]
+        h_r, w_r = tracker_r.old_gray.shape[:2]
+        self.lk_params = dict(tracker_l.lk_params)
+        self.guard = self.lk_params['winSize'][0] * 2 ** self.lk_params['maxLevel']
+        self.offset_x = w_l + self.guard    # 右侧图像在拼接图中的x偏移
+        self.shape_l = (h_l, w_l)
+        self.shape_r = (h_r, w_r)
+
+        # 两张拼接图交替使用，上一帧的拼接图保留为参考图像
+        shape = (max(h_l, h_r), self.offset_x + w_r)
+        self._canvases = [np.full(shape, self.GUARD_VALUE, dtype=np.uint8) for _ in range(2)]
+        self._canvas_index = 0
+        self.old_canvas = self.compose(tracker_l.old_gray, tracker_r.old_gray)
+
+        self.nct_l = tracker_l.nct
+        self._p0 = np.empty((tracker_l.nct + tracker_r.nct, 1, 2), dtype=np.float32)
+
+    def regions(self, canvas):
+        """拼接图中左右两路图像所在区域的视图"""
+        h_l, w_l = self.shape_l
+        h_r, w_r = self.shape_r
+        return canvas[:h_l, :w_l], canvas[:h_r, self.offset_x:self.offset_x + w_r]
+
+    def compose(self, gray_l, gray_r):
+        """将两路灰度图拷贝进下一张拼接图"""
+        canvas = self._canvases[self._canvas_index]
+        self._canvas_index ^= 1
+        region_l, region_r = self.regions(canvas)
+        region_l[...] = gray_l
+        region_r[...] = gray_r
+        return canvas
+
+    def to_canvas(self, frame_l, frame_r):
+        """将两路彩色图像直接转换为灰度写入下一张拼接图，无需中间拷贝"""
+        canvas = self._canvases[self._canvas_index]
+        self._canvas_index ^= 1
+        region_l, region_r = self.regions(canvas)
+        cv2.cvtColor(frame_l, cv2.COLOR_RGB2GRAY, dst=region_l)
+        cv2.cvtColor(frame_r, cv2.COLOR_RGB2GRAY, dst=region_r)
+        return canvas
+
+    def track(self, frame_l, frame_r, timestamp_l=None, timestamp_r=None):
+        """
+        对左右两帧执行一次合并的光流追踪
+        :return: (左侧 DisplacementRecord, 右侧 DisplacementRecord)
+        """
+        canvas = self.to_canvas(frame_l, frame_r)
+
+        # 合并两路追踪点，右侧x坐标平移到拼接图中的位置
+        n = self.nct_l
+        self._p0[:n] = self.tracker_l.p0
+        self._p0[n:] = self.tracker_r.p0
+        self._p0[n:, 0, 0] += self.offset_x
+
+        p1, st, err = cv2.calcOpticalFlowPyrLK(self.old_canvas, canvas, self._p0, None, **self.lk_params)
+        p1[n:, 0, 0] -= self.offset_x
+        self.old_canvas = canvas
+
+        # 拆分结果，各追踪器以拼接图中对应区域的视图作为参考图像
+        gray_l, gray_r = self.regions(canvas)
+        points_l, status_l, valid_l = self.tracker_l.update_points(gray_l, p1[:n], st[:n])
+        points_r, status_r, valid_r = self.tracker_r.update_points(gray_r, p1[n:], st[n:])
+        return (self.tracker_l.make_record(points_l, status_l, valid_l, timestamp_l),
+                self.tracker_r.make_record(points_r, status_r, valid_r, timestamp_r))
+
+
 def main():
     # 创建位移跟踪器实例
     displacement_tracker_l = DisplacementTracker(device_num=3)
     displacement_tracker_r = DisplacementTracker(device_num=0)
     frame_count = 0
+
+    # 左右传感器各自在后台线程中并发采集
+    capture = StereoCapture(displacement_tracker_l.cam_stream, displacement_tracker_r.cam_stream)
+    capture.start()
     
     try:
 
         while True:
-            # 获取帧
-            frame_l = displacement_tracker_l.cam_stream.update(1 / 30.0)
-            if frame_l is None:
+            # 获取左右帧对
+            pair = capture.get_pair(timeout=1.0)
+            if pair is None:
                 continue
+            frame_l, frame_r, timestamp_l, timestamp_r = pair
+
             # 初始化（第一帧）
             if not displacement_tracker_l.initialized:
                 displacement_tracker_l.initialize(frame_l)
                 continue
-
-            # 获取帧 
-            frame_r = displacement_tracker_r.cam_stream.update(1 / 30.0)
-            if frame_r is None:
-                continue
-            # 初始化（第一帧）
             if not displacement_tracker_r.initialized:
                 displacement_tracker_r.initialize(frame_r)
                 continue
@@ -414,8 +762,10 @@ def main():
             frame_count += 1
 
             # 获取x，y方向位移
-            avg_dx_l, avg_dy_l, _ = displacement_tracker_l.get_comprehensive_displacement(frame_l)
-            avg_dx_r, avg_dy_r, _ = displacement_tracker_r.get_comprehensive_displacement(frame_r)
+            record_l = displacement_tracker_l.track(frame_l, timestamp_l)
+            record_r = displacement_tracker_r.track(frame_r, timestamp_r)
+            avg_dx_l, avg_dy_l = record_l.mean_dx, record_l.mean_dy
+            avg_dx_r, avg_dy_r = record_r.mean_dx, record_r.mean_dy
 
 
             if frame_count % 90 ==0:  # 每3秒打印一次
@@ -430,6 +780,8 @@ def main():
                 
     except KeyboardInterrupt:
         print("\n程序被用户中断")
+    finally:
+        capture.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
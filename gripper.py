@@ -9,6 +9,28 @@ import serial
 import struct
 import time
 import sys
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+
+
+def _build_crc16_table():
+    """生成ModBus CRC16查表（多项式0xA001）"""
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 0x0001:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _build_crc16_table()
+
 
 class ElectricGripperController:
     """电爪控制器 - 使用纯串口实现ModBus RTU"""
@@ -53,18 +75,63 @@ class ElectricGripperController:
             5: "开始松开",
             6: "松开到位"
         }
+
+        # 固定命令的请求帧缓存，避免每次调用都重新构建并计算CRC
+        self._frame_cache = {}
+        self._prebuild_frames()
         
     def crc16_modbus(self, data):
-        """计算ModBus RTU CRC16校验码"""
+        """计算ModBus RTU CRC16校验码（查表法）"""
         crc = 0xFFFF
         for byte in data:
-            crc ^= byte
-            for _ in range(8):
-                if crc & 0x0001:
-                    crc = (crc >> 1) ^ 0xA001
-                else:
-                    crc >>= 1
-        return crc & 0xFFFF
+            crc = (crc >> 8) ^ CRC16_TABLE[(crc ^ byte) & 0xFF]
+        return crc
+
+    def check_crc(self, frame):
+        """校验带CRC的完整帧：对整帧（含CRC）计算结果为0即校验通过"""
+        return len(frame) >= 4 and self.crc16_modbus(frame) == 0
+
+    def build_frame(self, function, reg_addr, value):
+        """
+        构建请求帧（读寄存器时 value 为寄存器数量）
+        :return: 带CRC的请求帧
+        """
+        frame = bytearray([
+            self.slave_id,                  # 从机地址
+            function,                      # 功能码
+            (reg_addr >> 8) & 0xFF,        # 寄存器地址高字节
+            reg_addr & 0xFF,               # 寄存器地址低字节
+            (value >> 8) & 0xFF,           # 数据高字节
+            value & 0xFF                   # 数据低字节
+        ])
+
+        # 计算并添加CRC
+        crc = self.crc16_modbus(frame)
+        frame.extend([crc & 0xFF, (crc >> 8) & 0xFF])
+        return bytes(frame)
+
+    def _prebuild_frames(self):
+        """预先构建固定命令的请求帧"""
+        self._frame_cache.clear()
+        constant_frames = [
+            (0x06, self.REGISTERS['GRIP_CMD'], 1),
+            (0x06, self.REGISTERS['RELEASE_CMD'], 1),
+            (0x06, self.REGISTERS['SAVE_CONFIG'], 1),
+            (0x03, self.REGISTERS['STATUS'], 1),
+            (0x03, self.REGISTERS['CURRENT_READ'], 1),
+            (0x03, self.REGISTERS['SAVE_CONFIG'], 1),
+            (0x03, self.REGISTERS['STATUS'], 4),
+        ]
+        for function, reg_addr, value in constant_frames:
+            self._frame_cache[(self.slave_id, function, reg_addr, value)] = \
+                self.build_frame(function, reg_addr, value)
+
+    def get_frame(self, function, reg_addr, value):
+        """获取请求帧，固定命令直接使用缓存"""
+        frame = self._frame_cache.get((self.slave_id, function, reg_addr, value))
+        if frame is None:
+            frame = self.build_frame(function, reg_addr, value)
+        return frame
     
     def connect(self):
         """连接串口"""
@@ -101,18 +168,7 @@ class ElectricGripperController:
             return None
         
         # 构建请求帧
-        frame = bytearray([
-            self.slave_id,                  # 从机地址
-            0x03,                          # 功能码
-            (reg_addr >> 8) & 0xFF,        # 起始地址高字节
-            reg_addr & 0xFF,               # 起始地址低字节
-            (count >> 8) & 0xFF,           # 寄存器数量高字节
-            count & 0xFF                   # 寄存器数量低字节
-        ])
-        
-        # 计算并添加CRC
-        crc = self.crc16_modbus(frame)
-        frame.extend([crc & 0xFF, (crc >> 8) & 0xFF])
+        frame = self.get_frame(0x03, reg_addr, count)
         
         try:
             # 清空缓冲区
@@ -127,6 +183,11 @@ class ElectricGripperController:
             if len(response) < 5:
                 print("响应数据不完整")
                 return None
+
+            # 校验CRC
+            if not self.check_crc(response):
+                print("响应CRC校验失败")
+                return None
             
             # 验证响应
             if response[0] != self.slave_id or response[1] != 0x03:
@@ -168,18 +229,7 @@ class ElectricGripperController:
         value = value & 0xFFFF
         
         # 构建请求帧
-        frame = bytearray([
-            self.slave_id,                  # 从机地址
-            0x06,                          # 功能码
-            (reg_addr >> 8) & 0xFF,        # 寄存器地址高字节
-            reg_addr & 0xFF,               # 寄存器地址低字节
-            (value >> 8) & 0xFF,           # 数据高字节
-            value & 0xFF                   # 数据低字节
-        ])
-        
-        # 计算并添加CRC
-        crc = self.crc16_modbus(frame)
-        frame.extend([crc & 0xFF, (crc >> 8) & 0xFF])
+        frame = self.get_frame(0x06, reg_addr, value)
         
         try:
             # 清空缓冲区
@@ -191,9 +241,12 @@ class ElectricGripperController:
             # 接收响应（写命令会回显）
             response = self.ser.read(8)
             
-            # 验证响应（应该与请求相同）
+            # 验证响应（应该与请求相同，回显相同即CRC正确）
             if len(response) == 8 and response == frame:
                 return True
+            elif len(response) == 8 and not self.check_crc(response):
+                print("写入响应CRC校验失败")
+                return False
             else:
                 print("写入响应验证失败")
                 return False
@@ -202,6 +255,60 @@ class ElectricGripperController:
             print(f"写入寄存器失败: {e}")
             return False
     
+    def write_multiple_registers(self, reg_addr, values):
+        """
+        写入多个连续寄存器 (功能码10)
+        :param reg_addr: 起始寄存器地址
+        :param values: 写入的值列表
+        :return: 是否成功
+        """
+        if not self.ser or not self.ser.is_open:
+            print("串口未连接")
+            return False
+
+        count = len(values)
+
+        # 构建请求帧
+        frame = bytearray([
+            self.slave_id,                  # 从机地址
+            0x10,                          # 功能码
+            (reg_addr >> 8) & 0xFF,        # 起始地址高字节
+            reg_addr & 0xFF,               # 起始地址低字节
+            (count >> 8) & 0xFF,           # 寄存器数量高字节
+            count & 0xFF,                  # 寄存器数量低字节
+            count * 2                      # 数据字节数
+        ])
+        for value in values:
+            value = value & 0xFFFF
+            frame.extend([(value >> 8) & 0xFF, value & 0xFF])
+
+        # 计算并添加CRC
+        crc = self.crc16_modbus(frame)
+        frame.extend([crc & 0xFF, (crc >> 8) & 0xFF])
+
+        try:
+            # 清空缓冲区
+            self.ser.reset_input_buffer()
+
+            # 发送请求
+            self.ser.write(frame)
+
+            # 接收响应（回显起始地址和寄存器数量）
+            response = self.ser.read(8)
+
+            # 验证响应
+            if len(response) == 8 and self.check_crc(response) and response[:6] == frame[:6]:
+                return True
+            if len(response) >= 5 and response[1] == 0x90:
+                print(f"设备返回异常码: {response[2]}")
+            else:
+                print("写入响应验证失败")
+            return False
+
+        except Exception as e:
+            print(f"写入寄存器失败: {e}")
+            return False
+
     def write_double_register(self, reg_addr, value):
         """
         写入双寄存器（32位值，按文档的Little-endian swap格式）
@@ -212,13 +319,9 @@ class ElectricGripperController:
         # 按照文档说明的Little-endian swap格式
         low_word = value & 0xFFFF
         high_word = (value >> 16) & 0xFFFF
-        
-        # 先写低字寄存器，再写高字寄存器
-        success1 = self.write_single_register(reg_addr, low_word)
-        time.sleep(0.01)  # 短暂延时
-        success2 = self.write_single_register(reg_addr + 1, high_word)
-        
-        return success1 and success2
+
+        # 低字在前，高字在后，一次事务写入
+        return self.write_multiple_registers(reg_addr, [low_word, high_word])
     
     def set_control_mode(self, mode):
         """
@@ -296,6 +399,24 @@ class ElectricGripperController:
             return current
         return None
     
+    def read_status_snapshot(self):
+        """
+        一次事务读取 STATUS、CURRENT_READ 和 SPEED_READ (0x0040-0x0043)
+        :return: {'status', 'status_text', 'current', 'speed'}，失败时返回 None
+        """
+        values = self.read_holding_registers(self.REGISTERS['STATUS'], 4)
+        if not values:
+            return None
+
+        status_code = values[0]
+        return {
+            'status': status_code,
+            'status_text': self.STATUS_CODES.get(status_code, f"未知状态({status_code})"),
+            'current': values[1],
+            # 速度为双寄存器，Little-endian swap格式：低字在前
+            'speed': values[2] | (values[3] << 16),
+        }
+
     def save_config(self):
         """保存配置到设备"""
         success = self.write_single_register(self.REGISTERS['SAVE_CONFIG'], 1)
@@ -321,6 +442,108 @@ class ElectricGripperController:
             print('设备连接失败')
         return status[0] is not None if status else False
 
+class GripperCommandQueue:
+    """
+    电爪异步命令队列
+    所有串口读写都在专用的I/O线程中顺序执行，调用方立即得到 Future，
+    不会被RS-485的往返延迟阻塞。优先级数值越小越先执行，
+    因此紧急松开会插到排队中的状态读取和配置写入之前；
+    排队中尚未执行的夹紧命令会被松开取消，不会在松开之后再把电爪夹紧。
+    """
+    PRIORITY_EMERGENCY = 0  # 紧急松开
+    PRIORITY_MOTION = 1     # 夹紧等动作命令
+    PRIORITY_STATUS = 2     # 状态读取
+    PRIORITY_CONFIG = 3     # 配置写入
+
+    def __init__(self, gripper, tracer=None):
+        """
+        :param gripper: 已连接的 ElectricGripperController
+        :param tracer: 可选的 instrumentation.Tracer，记录命令排队等待时间和执行（写入并收到应答）耗时
+        """
+        self.gripper = gripper
+        self.tracer = tracer
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()  # 同一优先级按提交顺序执行
+        self._thread = None
+        self._pending_grips = []           # 已提交、尚未执行完的夹紧命令
+        self._motion_lock = threading.Lock()
+
+    def start(self):
+        """启动I/O线程"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name='gripper-io', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """执行完已排队的命令后停止I/O线程"""
+        if self._thread is None:
+            return
+        # 停止标记的优先级低于所有命令
+        self._queue.put((self.PRIORITY_CONFIG + 1, next(self._counter), None, (), None, 0))
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, func, *args, priority=PRIORITY_CONFIG):
+        """
+        提交一条命令
+        :param func: 在I/O线程中执行的可调用对象（通常是 ElectricGripperController 的方法）
+        :param priority: 优先级，数值越小越先执行
+        :return: Future，结果为 func 的返回值
+        """
+        future = Future()
+        self._queue.put((priority, next(self._counter), func, args, future, time.perf_counter_ns()))
+        return future
+
+    def _worker(self):
+        while True:
+            priority, _, func, args, future, submit_ns = self._queue.get()
+            if func is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            tracer = self.tracer
+            if tracer is not None:
+                start = time.perf_counter_ns()
+                tracer.record('modbus.queue_wait', start - submit_ns)
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                if tracer is not None:
+                    tracer.record_since(f'modbus.{func.__name__}', start)
+
+    def grip(self):
+        with self._motion_lock:
+            future = self.submit(self.gripper.grip, priority=self.PRIORITY_MOTION)
+            self._pending_grips = [f for f in self._pending_grips if not f.done()] + [future]
+        return future
+
+    def release(self):
+        """
+        紧急松开，排在所有夹紧之外的命令之前
+        仍在排队的夹紧命令被取消（其 Future 变为 cancelled）；已在执行的夹紧会先完成，
+        松开紧随其后执行，因此最终状态总是松开
+        """
+        with self._motion_lock:
+            for future in self._pending_grips:
+                future.cancel()
+            self._pending_grips = []
+            return self.submit(self.gripper.release, priority=self.PRIORITY_EMERGENCY)
+
+    def set_grip_current(self, current):
+        return self.submit(self.gripper.set_grip_current, current, priority=self.PRIORITY_CONFIG)
+
+    def set_grip_speed(self, speed):
+        return self.submit(self.gripper.set_grip_speed, speed, priority=self.PRIORITY_CONFIG)
+
+    def save_config(self):
+        return self.submit(self.gripper.save_config, priority=self.PRIORITY_CONFIG)
+
+    def read_status_snapshot(self):
+        return self.submit(self.gripper.read_status_snapshot, priority=self.PRIORITY_STATUS)
+
+
 def main():
     """主程序"""
     print("=" * 50)
@@ -0,0 +1,197 @@
+"""
+低开销的延迟埋点
+
+LatencyHistogram 为 HDR 风格的对数-线性直方图：每个 2 的幂区间再均分为 2^SUB_BUCKET_BITS 个桶，
+记录一次只需一次位运算和一次计数加一，相对误差不超过 1/2^SUB_BUCKET_BITS，内存大小固定。
+
+Tracer 为每个处理阶段（采集、灰度转换、光流、检测器、状态判断、Modbus 读写等）维护一个直方图，
+并为每帧分配追踪编号（trace id），最近的阶段事件按编号保存在有界队列中，可随时导出。
+端到端指标（例如从滑移帧被采集到松开命令被电爪确认）同样记录在直方图中。
+Tracer 关闭（enabled=False）时所有记录函数立即返回。
+"""
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+
+class LatencyHistogram:
+    """
+    对数-线性延迟直方图（单位：纳秒）
+    """
+    SUB_BUCKET_BITS = 5         # 每个 2 的幂区间分为 32 个桶，相对误差约 3%
+    MAX_VALUE_BITS = 40         # 最大可记录约 2^40 ns（约18分钟），更大的值记入最后一个桶
+
+    def __init__(self):
+        self.sub_count = 1 << self.SUB_BUCKET_BITS
+        max_shift = self.MAX_VALUE_BITS - self.SUB_BUCKET_BITS - 1
+        self.n_buckets = (max_shift + 2) * self.sub_count
+        self.clear()
+
+    def clear(self):
+        self.counts = [0] * self.n_buckets
+        self.count = 0
+        self.total = 0
+        self.min = 1 << 62
+        self.max = 0
+
+    def bucket_upper(self, index):
+        """桶内可记录的最大值"""
+        shift = max(0, index // self.sub_count - 1)
+        top = index - shift * self.sub_count
+        return ((top + 1) << shift) - 1
+
+    def record(self, value):
+        value = int(value)
+        if value < 0:
+            value = 0
+        # 桶编号：小于 2*sub_count 的值每个整数一个桶，更大的值每个 2 的幂区间 sub_count 个桶
+        shift = value.bit_length() - self.SUB_BUCKET_BITS - 1
+        index = value if shift <= 0 else shift * self.sub_count + (value >> shift)
+        if index >= self.n_buckets:
+            index = self.n_buckets - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """第 p 百分位数（桶上界，不超过实际最大值）"""
+        if self.count == 0:
+            return None
+        target = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(self.bucket_upper(index), self.max)
+        return self.max
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        """统计摘要（毫秒）"""
+        if self.count == 0:
+            return {'count': 0}
+        result = {
+            'count': self.count,
+            'mean_ms': self.total / self.count / 1e6,
+            'min_ms': self.min / 1e6,
+            'max_ms': self.max / 1e6,
+        }
+        for p in percentiles:
+            result[f'p{p}_ms'] = self.percentile(p) / 1e6
+        return result
+
+
+class Tracer:
+    """
+    各处理阶段的延迟记录。
+    阶段耗时用 time.perf_counter_ns() 计时；与图像采集时刻相关的端到端延迟
+    使用采集时的 time.time() 时间戳，以便跨线程比较。
+    """
+    def __init__(self, enabled=True, max_events=4096):
+        """
+        :param enabled: 是否记录
+        :param max_events: 保存最近的 (trace id, 阶段, 耗时) 事件数
+        """
+        self.enabled = enabled
+        self.histograms = {}
+        self.events = deque(maxlen=max_events)
+        self.trace_id = 0           # 最近一帧的追踪编号
+        self.capture_time = None    # 最近一帧的采集时刻（time.time()）
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        hist = self.histograms.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(stage, LatencyHistogram())
+        return hist
+
+    def begin_frame(self, capture_time=None):
+        """
+        开始新的一帧，分配追踪编号
+        :param capture_time: 该帧的采集时刻（time.time()），用于计算端到端延迟
+        :return: 追踪编号
+        """
+        self.trace_id += 1
+        self.capture_time = time.time() if capture_time is None else capture_time
+        return self.trace_id
+
+    def record(self, stage, duration_ns, trace_id=None):
+        """记录一个阶段的耗时（纳秒）；未指定 trace_id 时归入当前帧"""
+        if not self.enabled:
+            return
+        self.histogram(stage).record(duration_ns)
+        self.events.append((self.trace_id if trace_id is None else trace_id, stage, duration_ns))
+
+    def record_since(self, stage, start_ns, trace_id=None):
+        """记录从 start_ns（time.perf_counter_ns()）到现在的耗时"""
+        if not self.enabled:
+            return
+        self.record(stage, time.perf_counter_ns() - start_ns, trace_id)
+
+    def record_from_capture(self, stage, capture_time, trace_id=None):
+        """记录从图像采集时刻（time.time()）到现在的端到端延迟"""
+        if not self.enabled or capture_time is None:
+            return
+        self.record(stage, int((time.time() - capture_time) * 1e9), trace_id)
+
+    def trace(self, trace_id):
+        """某一帧的全部阶段事件 [(阶段, 耗时 ns)]"""
+        return [(stage, duration) for tid, stage, duration in list(self.events) if tid == trace_id]
+
+    def summary(self):
+        return {stage: hist.summary() for stage, hist in sorted(self.histograms.items())}
+
+    def clear(self):
+        with self._lock:
+            for hist in self.histograms.values():
+                hist.clear()
+            self.events.clear()
+
+    def report(self):
+        """打印各阶段延迟统计"""
+        print('\n' + '=' * 88)
+        print(f"{'stage':<32}{'count':>8}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+        print('-' * 88)
+        for stage, s in self.summary().items():
+            if s['count'] == 0:
+                continue
+            print(f"{stage:<32}{s['count']:>8}{s['mean_ms']:9.3f}{s['p50_ms']:9.3f}"
+                  f"{s['p90_ms']:9.3f}{s['p99_ms']:9.3f}{s['max_ms']:9.3f}")
+        print('=' * 88)
+        print('单位: 毫秒 (ms)')
+
+    def dump(self, path):
+        """将统计摘要和最近的事件写入 JSON 文件"""
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'stages': self.summary(),
+            'events': [{'trace_id': tid, 'stage': stage, 'ms': duration / 1e6}
+                       for tid, stage, duration in list(self.events)],
+        }
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def traced(stage):
+    """
+    方法装饰器：对象的 tracer 属性不为 None 且已启用时记录方法耗时
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            tracer = self.tracer
+            if tracer is None or not tracer.enabled:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                tracer.record_since(stage, start)
+        return wrapper
+    return decorator
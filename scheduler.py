@@ -0,0 +1,36 @@
+import time
+
+
+class TickScheduler:
+    """
+    固定频率的节拍调度器。
+    每个节拍调用一次 on_tick(now)，节拍之间只在剩余时间内休眠，
+    处理超时的节拍不会累积追赶，而是从当前时刻重新对齐。
+    """
+    def __init__(self, rate_hz=30.0):
+        self.period = 1.0 / rate_hz
+        self.tick_count = 0
+        self.overruns = 0       # 处理时间超过一个周期的节拍数
+        self._running = False
+
+    def stop(self):
+        self._running = False
+
+    def run(self, on_tick):
+        """
+        持续调度直到 stop() 被调用
+        :param on_tick: 每个节拍调用的函数，参数为当前时刻（time.monotonic()）
+        """
+        self._running = True
+        next_time = time.monotonic()
+        while self._running:
+            on_tick(time.monotonic())
+            self.tick_count += 1
+
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.overruns += 1
+                next_time = time.monotonic()
@@ -0,0 +1,234 @@
+"""
+会话记录查询
+
+利用录制时同步生成的索引（.idx 中每个 chunk 的最小/最大值，.events 中的事件区间和状态切换）
+在大量会话文件中查找感兴趣的时间窗口。条件查询先用 chunk 索引排除不可能满足条件的 chunk，
+只读取剩余 chunk 的对应字段；返回的窗口都是记录文件内存映射的切片，不拷贝数据。
+录制中或异常中断的会话索引不完整，打开时在内存中重新建立（不改动文件）；
+--reindex 可重新生成索引文件。
+
+用法:
+    python session_query.py sessions/*.gss --event x_slip --context 15
+    python session_query.py sessions/*.gss --event disturbance
+    python session_query.py sessions/*.gss --where "liquid>50"
+    python session_query.py sessions/*.gss --state GRIPPING
+    python session_query.py sessions/*.gss --transitions
+"""
+import argparse
+import glob
+import os
+import re
+import time
+import numpy as np
+from session_recorder import (EVENT_END, EVENT_FIELDS, EVENT_STATE, EVENTS_SUFFIX, INDEX_SUFFIX,
+                              INDEXED_FIELDS, RecordedSession, SessionIndexer, open_memmap)
+
+OPS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+}
+
+
+def parse_condition(text):
+    """解析 'liquid>50' 形式的条件，返回 (字段, 运算符, 数值)"""
+    match = re.fullmatch(r'\s*(\w+)\s*(>=|<=|>|<)\s*(\S+)\s*', text)
+    if match is None:
+        raise ValueError(f"无法解析条件: {text}")
+    field, op, value = match.groups()
+    return field, op, float(value)
+
+
+def mask_windows(mask, offset=0):
+    """布尔序列中连续为 True 的区间 [(start, stop)]，行号加上 offset"""
+    edges = np.flatnonzero(np.diff(mask.view(np.int8), prepend=0, append=0))
+    return [(offset + int(a), offset + int(b)) for a, b in zip(edges[::2], edges[1::2])]
+
+
+def merge_windows(windows):
+    """合并重叠或首尾相接的区间（按起始行排序）"""
+    merged = []
+    for start, stop in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def index_session(session, path=None):
+    """
+    逐 chunk 建立会话索引
+    :param path: 写入索引文件的会话路径；为 None 时只在内存中建立
+    :return: (chunk 索引记录, 事件记录)，写入文件时返回 None
+    """
+    indexer = SessionIndexer(path, dict(session=os.path.basename(session.path), states=session.states))
+    for start in range(0, len(session), session.chunk_rows):
+        indexer.add(session.rows[start:start + session.chunk_rows])
+    indexer.finish()
+    return None if path is not None else indexer.arrays()
+
+
+def build_index(path):
+    """重新生成会话文件的索引文件（.idx / .events）"""
+    index_session(RecordedSession(path), path)
+
+
+class SessionIndex:
+    """一个会话文件及其索引"""
+    def __init__(self, path):
+        self.path = path
+        self.session = RecordedSession(path)
+        self.rows = self.session.rows
+        self.chunks, self.events = self.load()
+        self.chunks_scanned = 0     # 最近一次条件查询实际读取的 chunk 数
+
+    def load(self):
+        """读取索引文件；索引缺失或不完整时在内存中重新建立"""
+        try:
+            _, chunks = open_memmap(self.path + INDEX_SUFFIX)
+            _, events = open_memmap(self.path + EVENTS_SUFFIX)
+        except (OSError, ValueError):
+            return index_session(self.session)
+
+        # 正常结束的索引以 END 标记收尾，且覆盖全部记录
+        n = len(self.rows)
+        complete = (len(events) > 0 and events['kind'][-1] == EVENT_END and events['start'][-1] == n
+                    and int(chunks['count'].sum()) == n)
+        if not complete:
+            return index_session(self.session)
+        return chunks, events
+
+    def event_windows(self, name):
+        """检测器输出连续为 1 的区间，name 为 EVENT_FIELDS 之一"""
+        kind = EVENT_FIELDS.index(name)
+        events = self.events[self.events['kind'] == kind]
+        return [(int(start), int(stop)) for start, stop in zip(events['start'], events['stop'])]
+
+    def transitions(self):
+        """状态切换 [(行号, 原状态名, 新状态名)]，会话开始时原状态为 None"""
+        events = self.events[self.events['kind'] == EVENT_STATE]
+        return [(int(e['start']), self.state_name(e['prev']), self.state_name(e['value']))
+                for e in events]
+
+    def state_name(self, code):
+        if 0 <= code < len(self.session.states):
+            return self.session.states[code]
+        return None
+
+    def state_windows(self, state):
+        """处于某一状态的区间"""
+        transitions = self.transitions()
+        starts = [row for row, _, _ in transitions] + [len(self.rows)]
+        return [(starts[i], starts[i + 1]) for i, (_, _, name) in enumerate(transitions)
+                if name == state]
+
+    def where(self, field, op, value):
+        """
+        标量字段满足条件的区间，例如 where('liquid', '>', 50)
+        :param field: INDEXED_FIELDS 之一
+        """
+        if field not in INDEXED_FIELDS:
+            raise ValueError(f"{field} 没有索引，可查询的字段: {', '.join(INDEXED_FIELDS)}")
+        compare = OPS[op]
+        # 大于类条件看 chunk 最大值，小于类条件看最小值；NaN（无数据）的比较结果为 False
+        bound = self.chunks[field + ('_max' if op.startswith('>') else '_min')]
+        candidates = self.chunks[compare(bound, value)]
+        self.chunks_scanned = len(candidates)
+
+        windows = []
+        column = self.rows[field]
+        for start, count in zip(candidates['start'], candidates['count']):
+            windows += mask_windows(compare(column[start:start + count], value), int(start))
+        return merge_windows(windows)
+
+    def select(self, event=None, where=None, state=None):
+        """按事件、条件 (字段, 运算符, 数值) 或状态选择区间；都未指定时返回整个会话"""
+        if event is not None:
+            return self.event_windows(event)
+        if where is not None:
+            return self.where(*where)
+        if state is not None:
+            return self.state_windows(state)
+        return [(0, len(self.rows))]
+
+    def slices(self, windows, before=0, after=0):
+        """区间对应的记录切片（内存映射视图），前后各扩展 before / after 行"""
+        n = len(self.rows)
+        return [self.rows[max(0, start - before):min(n, stop + after)] for start, stop in windows]
+
+
+def query(paths, event=None, where=None, state=None, before=0, after=0):
+    """
+    在多个会话文件中查询，逐个返回 (SessionIndex, (start, stop), 记录切片)
+    :param event: 检测器事件名（EVENT_FIELDS 之一）
+    :param where: 条件 (字段, 运算符, 数值) 或 'liquid>50' 形式的字符串
+    :param state: 状态名
+    :param before, after: 窗口前后扩展的行数
+    """
+    if isinstance(where, str):
+        where = parse_condition(where)
+    for path in paths:
+        index = SessionIndex(path)
+        windows = index.select(event, where, state)
+        for window, rows in zip(windows, index.slices(windows, before, after)):
+            yield index, window, rows
+
+
+def format_time(timestamp):
+    milliseconds = int(timestamp * 1000) % 1000
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) + f'.{milliseconds:03d}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query recorded GelSight gripper sessions.")
+    parser.add_argument('paths', nargs='+', help="Session files (.gss); glob patterns are expanded.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--event', choices=EVENT_FIELDS, help="Windows where a detector output was 1.")
+    group.add_argument('--where', help="Condition on an indexed field, e.g. 'liquid>50' or 'mean_dx_l<-0.5'.")
+    group.add_argument('--state', help="Windows spent in a state-machine state.")
+    group.add_argument('--transitions', action='store_true', help="List state-machine transitions.")
+    parser.add_argument('--context', type=int, default=0, help="Rows of context before and after each window.")
+    parser.add_argument('--reindex', action='store_true', help="Rebuild the index files before querying.")
+    args = parser.parse_args()
+
+    paths = []
+    for pattern in args.paths:
+        paths += sorted(glob.glob(pattern)) or [pattern]
+    paths = [path for path in paths if not path.endswith(('.frames', INDEX_SUFFIX, EVENTS_SUFFIX))]
+
+    if args.reindex:
+        for path in paths:
+            build_index(path)
+
+    if args.transitions:
+        for path in paths:
+            index = SessionIndex(path)
+            for row, prev, new in index.transitions():
+                print(f"{path}  row {row:8d}  {format_time(index.rows['timestamp'][row])}  {prev} -> {new}")
+        return
+
+    where = parse_condition(args.where) if args.where else None
+    n_windows = scanned = total = 0
+    for path in paths:
+        index = SessionIndex(path)
+        windows = index.select(args.event, where, args.state)
+        scanned += index.chunks_scanned if where else len(index.chunks)
+        total += len(index.chunks)
+        timestamps = index.rows['timestamp']
+        for (start, stop), rows in zip(windows, index.slices(windows, args.context, args.context)):
+            duration = timestamps[stop - 1] - timestamps[start]
+            line = f"{path}  rows {start:8d}-{stop:<8d} {format_time(timestamps[start])}  {duration:7.2f}s"
+            if where:
+                values = index.rows[where[0]][start:stop]
+                line += f"  {where[0]} [{values.min():.3f}, {values.max():.3f}]"
+            print(line + f"  ({len(rows)} rows with context)")
+        n_windows += len(windows)
+
+    print(f"{n_windows} 个窗口，{len(paths)} 个会话文件")
+    if where:
+        print(f"读取了 {scanned} / {total} 个 chunk（其余由索引排除）")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,534 @@
+"""
+触觉与电爪运行数据记录
+
+每个控制节拍写入一行定长的结构化记录（NumPy structured dtype）：左右位移场、追踪状态、
+平均位移、各检测器输出、状态机状态以及最近一次电爪寄存器快照。
+可选地把原始图像帧写入单独的旁路文件。
+
+文件格式（记录文件和图像帧文件相同）:
+    HEADER_SIZE 字节的文件头: MAGIC + 4 字节头长度 + JSON（dtype、标记点数量、状态名等），补零对齐
+    之后为连续追加的定长记录，按 chunk 批量写入
+记录数由文件大小推算，因此文件可以在录制过程中或异常中断后直接以 np.memmap 打开，
+中断时只丢失最后一个未写满的 chunk。
+
+写入线程每写出一个 chunk 同时更新查询索引（SessionIndexer，见 session_query）:
+    path + '.idx':    每个 chunk 的起始行、时间范围以及 INDEXED_FIELDS 各字段的最小/最大值
+    path + '.events': 检测器输出连续为 1 的区间、状态切换，以及正常结束时的 END 标记
+
+控制循环只把数据拷贝进预分配的 chunk 缓冲区，写满后交给后台写入线程；
+缓冲区数量固定，内存占用与录制时长无关。磁盘过慢导致缓冲区用尽时丢弃新数据并计数，
+控制循环从不等待磁盘 I/O（丢弃的行可由 frame 字段的间断看出）。
+
+用法:
+    recorder = SessionRecorder('session.gss', states=sorted(WatercupStateMachine.VALID_STATES))
+    recorder.start()
+    每个节拍: recorder.record(gsmini, state_machine.state)
+    recorder.close()
+
+    session = load_session('session.gss')
+    session.rows['mean_dx_l']       # 内存映射，不读入整个文件
+"""
+import functools
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import numpy as np
+
+MAGIC = b'GSSESS01'
+HEADER_SIZE = 4096
+FRAMES_SUFFIX = '.frames'
+INDEX_SUFFIX = '.idx'
+EVENTS_SUFFIX = '.events'
+
+# 建立 chunk 级最小/最大值索引的标量字段
+INDEXED_FIELDS = ('mean_dx_l', 'mean_dy_l', 'mean_total_l', 'mean_dx_r', 'mean_dy_r', 'mean_total_r',
+                  'liquid')
+# 检测器输出字段，连续为 1 的帧记为一个事件，事件类型为其下标
+EVENT_FIELDS = ('contact', 'x_slip', 'y_slip', 'rolling', 'disturbance')
+EVENT_STATE = len(EVENT_FIELDS)     # 状态切换：value 为新状态编号，prev 为原状态编号（开始时为 -1）
+EVENT_END = 255                     # 索引完整写出的标记，start 为记录总行数
+
+EVENT_DTYPE = np.dtype([
+    ('kind', np.uint8),
+    ('start', np.int64),            # 起始行（含）
+    ('stop', np.int64),             # 结束行（不含）
+    ('value', np.int16),
+    ('prev', np.int16),
+])
+
+
+def recorded_output(name):
+    """
+    方法装饰器：把检测器的返回值保存到对象的 outputs 字典中，供 SessionRecorder 写入本帧记录
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            self.outputs[name] = result
+            return result
+        return wrapper
+    return decorator
+
+
+def session_dtype(nct_l, nct_r):
+    """
+    每个节拍一行的记录格式。
+    检测器在本节拍未被调用时记为 -1（液量为 NaN），电爪快照不可用时记为 -1；
+    未追踪的帧（tracked 为 False）位移字段为 NaN
+    """
+    return np.dtype([
+        ('frame', np.int64),            # 节拍序号（从 0 开始，丢弃的行会留下间断）
+        ('timestamp', np.float64),      # 采集时刻 time.time()
+        ('trace_id', np.int64),         # instrumentation.Tracer 的追踪编号，未启用时为 0
+        ('state', np.uint8),            # 状态编号，对应文件头中的 states，未知状态为 255
+        ('tracked', np.bool_),          # 本帧是否进行了完整追踪（接触预检测未触发时为 False）
+        ('valid_l', np.bool_),
+        ('valid_r', np.bool_),
+        ('mean_dx_l', np.float32),
+        ('mean_dy_l', np.float32),
+        ('mean_total_l', np.float32),
+        ('mean_dx_r', np.float32),
+        ('mean_dy_r', np.float32),
+        ('mean_total_r', np.float32),
+        ('field_l', np.float32, (nct_l, 2)),
+        ('field_r', np.float32, (nct_r, 2)),
+        ('status_l', np.bool_, (nct_l,)),
+        ('status_r', np.bool_, (nct_r,)),
+        ('contact', np.int8),           # judge_contact
+        ('x_slip', np.int8),            # detect_slip
+        ('y_slip', np.int8),
+        ('rolling', np.int8),           # detect_scroll
+        ('disturbance', np.int8),       # identify_disturbance
+        ('liquid', np.float32),         # perceive_weight
+        ('gripper_status', np.int32),   # 电爪 STATUS 寄存器
+        ('gripper_current', np.int32),  # 电爪 CURRENT_READ 寄存器
+        ('gripper_speed', np.int32),    # 电爪 SPEED_READ 寄存器
+        ('gripper_time', np.float64),   # 快照读取完成的时刻，无快照时为 0
+        ('frame_index', np.int64),      # 原始图像在图像帧文件中的序号，未保存时为 -1
+    ])
+
+
+def chunk_index_dtype():
+    """.idx 文件中每个 chunk 一条的索引记录；字段全为 NaN 的 chunk 最小/最大值为 NaN"""
+    fields = [('start', np.int64), ('count', np.int32), ('t_min', np.float64), ('t_max', np.float64)]
+    for name in INDEXED_FIELDS:
+        fields += [(name + '_min', np.float32), (name + '_max', np.float32)]
+    return np.dtype(fields)
+
+
+def write_header(f, dtype, shape=(), **meta):
+    """写入定长文件头"""
+    header = dict(meta, dtype=np.lib.format.dtype_to_descr(dtype), shape=list(shape))
+    payload = json.dumps(header).encode('utf-8')
+    if len(MAGIC) + 4 + len(payload) > HEADER_SIZE:
+        raise ValueError(f"文件头超过 {HEADER_SIZE} 字节")
+    f.write((MAGIC + struct.pack('<I', len(payload)) + payload).ljust(HEADER_SIZE, b'\0'))
+
+
+def read_header(path):
+    """读取文件头，返回 (头信息 dict, 单条记录的 dtype)"""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE or not raw.startswith(MAGIC):
+        raise ValueError(f"不是会话记录文件: {path}")
+    length, = struct.unpack_from('<I', raw, len(MAGIC))
+    header = json.loads(raw[len(MAGIC) + 4:len(MAGIC) + 4 + length].decode('utf-8'))
+    dtype = np.lib.format.descr_to_dtype(header['dtype'])
+    if header['shape']:
+        dtype = np.dtype((dtype, tuple(header['shape'])))
+    return header, dtype
+
+
+def open_memmap(path):
+    """以只读内存映射打开记录文件，返回 (头信息, 记录数组)；末尾不完整的记录被忽略"""
+    header, dtype = read_header(path)
+    n = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if n == 0:
+        return header, np.zeros((0,) + dtype.shape, dtype=dtype.base)
+    return header, np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(n,))
+
+
+class SessionIndexer:
+    """
+    按写入顺序逐 chunk 建立会话索引。path 为 None 时索引只保存在内存中（arrays() 取回）
+    """
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.meta = dict(meta or {})
+        self.chunk_dtype = chunk_index_dtype()
+        self.rows = 0                               # 已索引的行数
+        self.run_start = [None] * len(EVENT_FIELDS) # 尚未结束的事件的起始行
+        self.state = -1                             # 上一行的状态编号
+        self.files = {}
+        self.records = {INDEX_SUFFIX: [], EVENTS_SUFFIX: []}
+
+    def _append(self, suffix, records):
+        if len(records) == 0:
+            return
+        if self.path is None:
+            self.records[suffix].append(records)
+            return
+        f = self.files.get(suffix)
+        if f is None:
+            f = self.files[suffix] = open(self.path + suffix, 'wb')
+            write_header(f, records.dtype, **self.meta)
+        f.write(records.tobytes())
+        f.flush()
+
+    def add(self, rows):
+        """索引紧接在已索引部分之后的一段记录"""
+        n = len(rows)
+        if n == 0:
+            return
+        start = self.rows
+        summary = np.zeros(1, dtype=self.chunk_dtype)
+        summary['start'] = start
+        summary['count'] = n
+        timestamps = rows['timestamp']
+        summary['t_min'] = timestamps.min()
+        summary['t_max'] = timestamps.max()
+        for name in INDEXED_FIELDS:
+            values = rows[name]
+            values = values[np.isfinite(values)]
+            summary[name + '_min'] = values.min() if len(values) else np.nan
+            summary[name + '_max'] = values.max() if len(values) else np.nan
+
+        events = []
+        for kind, name in enumerate(EVENT_FIELDS):
+            active = (rows[name] == 1).view(np.int8)
+            # 与上一个 chunk 末尾衔接：变化点即事件的开始或结束
+            was_active = int(self.run_start[kind] is not None)
+            for i in np.flatnonzero(np.diff(active, prepend=was_active)):
+                if active[i]:
+                    self.run_start[kind] = start + i
+                else:
+                    events.append((kind, self.run_start[kind], start + i, 1, 0))
+                    self.run_start[kind] = None
+
+        states = rows['state'].astype(np.int16)
+        for i in np.flatnonzero(np.diff(states, prepend=self.state)):
+            prev = self.state if i == 0 else states[i - 1]
+            events.append((EVENT_STATE, start + i, start + i + 1, states[i], prev))
+        self.state = int(states[-1])
+        self.rows += n
+
+        self._append(INDEX_SUFFIX, summary)
+        events.sort(key=lambda event: event[1])
+        self._append(EVENTS_SUFFIX, np.array(events, dtype=EVENT_DTYPE))
+
+    def finish(self):
+        """结束仍在进行的事件并写入 END 标记"""
+        events = [(kind, run_start, self.rows, 1, 0)
+                  for kind, run_start in enumerate(self.run_start) if run_start is not None]
+        self.run_start = [None] * len(EVENT_FIELDS)
+        events.append((EVENT_END, self.rows, self.rows, 0, 0))
+        self._append(EVENTS_SUFFIX, np.array(events, dtype=EVENT_DTYPE))
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def arrays(self):
+        """内存索引: (chunk 索引记录, 事件记录)"""
+        chunks = self.records[INDEX_SUFFIX]
+        events = self.records[EVENTS_SUFFIX]
+        return (np.concatenate(chunks) if chunks else np.zeros(0, dtype=self.chunk_dtype),
+                np.concatenate(events) if events else np.zeros(0, dtype=EVENT_DTYPE))
+
+
+class ChunkStream:
+    """
+    一个输出文件的分块缓冲：固定数量的预分配 chunk 在控制线程和写入线程之间轮转。
+    没有空闲 chunk 时 slot() 返回 None，调用方丢弃该条数据
+    """
+    def __init__(self, path, dtype, shape, chunk_len, n_buffers, meta, on_write=None):
+        """
+        :param on_write: 每个 chunk 写入文件后在写入线程中调用 on_write(已写入的记录)
+        """
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.meta = meta
+        self.free = queue.Queue()
+        for _ in range(n_buffers):
+            self.free.put(np.zeros((chunk_len,) + self.shape, dtype=dtype))
+        self.chunk_len = chunk_len
+        self.current = None
+        self.fill = 0
+        self.count = 0          # 已接收的条数
+        self.dropped = 0        # 因缓冲区用尽而丢弃的条数
+        self.file = None        # 由写入线程打开
+        self.on_write = on_write
+
+    def slot(self):
+        """当前 chunk 中下一个可写入的位置；没有空闲缓冲区时返回 None"""
+        if self.current is None:
+            try:
+                self.current = self.free.get_nowait()
+            except queue.Empty:
+                self.dropped += 1
+                return None
+            self.fill = 0
+        return self.current[self.fill]
+
+    def commit(self, write_queue):
+        """确认写入 slot() 返回的位置；chunk 写满时交给写入线程"""
+        self.fill += 1
+        self.count += 1
+        if self.fill == self.chunk_len:
+            self.flush(write_queue)
+
+    def flush(self, write_queue):
+        """将当前（可能未写满的）chunk 交给写入线程"""
+        if self.current is not None and self.fill > 0:
+            write_queue.put((self, self.current, self.fill))
+            self.current = None
+            self.fill = 0
+
+    def write(self, buffer, n):
+        """在写入线程中执行：追加 n 条记录并归还缓冲区"""
+        try:
+            if self.file is None:
+                self.file = open(self.path, 'wb')
+                write_header(self.file, self.dtype, self.shape, **self.meta)
+            self.file.write(memoryview(buffer[:n]).cast('B'))
+            self.file.flush()
+            if self.on_write is not None:
+                self.on_write(buffer[:n])
+        finally:
+            self.free.put(buffer)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class SessionRecorder:
+    """
+    运行数据记录器。record() 只做内存拷贝，文件写入在后台线程中进行
+    """
+    VERSION = 1
+
+    def __init__(self, path, states=(), chunk_rows=256, row_buffers=8, record_frames=False,
+                 frame_every=1, frame_chunk=8, frame_buffers=4, meta=None):
+        """
+        :param path: 记录文件路径；图像帧写入 path + '.frames'
+        :param states: 状态名列表，记录中保存其下标
+        :param chunk_rows: 每个 chunk 的行数（也是写入批量和查询索引的粒度）
+        :param row_buffers: 记录 chunk 缓冲区数量
+        :param record_frames: 是否保存原始图像帧（左右两路）
+        :param frame_every: 每隔多少个追踪帧保存一次图像
+        :param frame_chunk: 每个图像 chunk 的帧数
+        :param frame_buffers: 图像 chunk 缓冲区数量
+        :param meta: 写入文件头的其他信息（可 JSON 序列化）
+        """
+        self.path = path
+        self.states = list(states)
+        self.state_codes = {state: i for i, state in enumerate(self.states)}
+        self.chunk_rows = chunk_rows
+        self.row_buffers = row_buffers
+        self.record_frames = record_frames
+        self.frame_every = frame_every
+        self.frame_chunk = frame_chunk
+        self.frame_buffers = frame_buffers
+        self.meta = dict(meta or {})
+
+        self.rows = None        # ChunkStream，第一帧时按标记点数量创建
+        self.frames = None
+        self.indexer = None     # SessionIndexer，只在写入线程中使用
+        self.frame_count = 0    # 已记录的节拍数
+        self.tracked_count = 0
+        self.gripper_snapshot = (-1, -1, -1, 0.0)
+
+        # 待写入的 chunk；容量等于缓冲区总数，put 不会阻塞
+        self._write_queue = queue.Queue(maxsize=row_buffers + frame_buffers + 2)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._writer, name='session-writer', daemon=True)
+            self._thread.start()
+
+    def _writer(self):
+        streams = set()
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                break
+            stream, buffer, n = item
+            streams.add(stream)
+            try:
+                stream.write(buffer, n)
+            except Exception as e:
+                # 写入失败只丢失该 chunk，写入线程继续运行
+                print(f"会话记录写入失败: {e!r}")
+        for stream in streams:
+            stream.close()
+        if self.indexer is not None:
+            self.indexer.finish()
+
+    def _open_streams(self, gsmini, frame_l):
+        origin_l = gsmini.displacement_tracker_l.origin
+        origin_r = gsmini.displacement_tracker_r.origin
+        if gsmini.tracking_pool is not None:
+            origin_l, origin_r = (worker.origin for worker in gsmini.tracking_pool.workers)
+        nct_l, nct_r = len(origin_l), len(origin_r)
+        meta = dict(self.meta, version=self.VERSION, created=time.time(), states=self.states,
+                    chunk_rows=self.chunk_rows, nct_l=nct_l, nct_r=nct_r,
+                    origin_l=np.asarray(origin_l).tolist(), origin_r=np.asarray(origin_r).tolist())
+        # 标记点初始位置可能使文件头超长，超长时不保存
+        if len(json.dumps(meta)) > HEADER_SIZE - 512:
+            del meta['origin_l'], meta['origin_r']
+        self.indexer = SessionIndexer(self.path, dict(session=os.path.basename(self.path),
+                                                      states=self.states))
+        self.rows = ChunkStream(self.path, session_dtype(nct_l, nct_r), (), self.chunk_rows,
+                                self.row_buffers, meta, on_write=self.indexer.add)
+        if self.record_frames and frame_l is not None:
+            self.frames = ChunkStream(self.path + FRAMES_SUFFIX, np.uint8, (2,) + frame_l.shape,
+                                      self.frame_chunk, self.frame_buffers,
+                                      dict(version=self.VERSION, session=os.path.basename(self.path)))
+
+    def update_gripper(self, future):
+        """
+        登记一次电爪状态读取（GripperCommandQueue.read_status_snapshot() 返回的 Future），
+        完成后其结果写入之后各帧的记录
+        """
+        def done(f):
+            if f.cancelled() or f.exception() is not None:
+                return
+            snapshot = f.result()
+            if snapshot:
+                self.gripper_snapshot = (snapshot['status'], snapshot['current'], snapshot['speed'],
+                                         time.time())
+        future.add_done_callback(done)
+
+    def record(self, gsmini, state):
+        """
+        记录一个节拍：在 gsmini.get_frame() 和状态判断之后调用
+        :param gsmini: GSmini，读取其最近一帧的追踪记录和检测器输出
+        :param state: 当前状态名
+        """
+        record_l, record_r = gsmini.last_records
+        if record_l is None:
+            return
+        if self.rows is None:
+            self._open_streams(gsmini, gsmini.last_frames[0])
+
+        tracked = gsmini.tracking_active
+        frame_index = -1
+        if tracked:
+            self.tracked_count += 1
+            if self.frames is not None and (self.tracked_count - 1) % self.frame_every == 0:
+                slot = self.frames.slot()
+                if slot is not None:
+                    slot[0] = gsmini.last_frames[0]
+                    slot[1] = gsmini.last_frames[1]
+                    frame_index = self.frames.count
+                    self.frames.commit(self._write_queue)
+
+        frame = self.frame_count
+        self.frame_count += 1
+        row = self.rows.slot()
+        if row is None:
+            return
+
+        outputs = gsmini.outputs
+        tracer = gsmini.tracer
+        row['frame'] = frame
+        row['timestamp'] = gsmini.last_timestamp
+        row['trace_id'] = tracer.trace_id if tracer is not None else 0
+        row['state'] = self.state_codes.get(state, 255)
+        row['tracked'] = tracked
+        if tracked:
+            row['valid_l'] = record_l.valid
+            row['valid_r'] = record_r.valid
+            row['mean_dx_l'] = record_l.mean_dx
+            row['mean_dy_l'] = record_l.mean_dy
+            row['mean_total_l'] = record_l.mean_total
+            row['mean_dx_r'] = record_r.mean_dx
+            row['mean_dy_r'] = record_r.mean_dy
+            row['mean_total_r'] = record_r.mean_total
+            row['field_l'] = record_l.field
+            row['field_r'] = record_r.field
+            row['status_l'] = record_l.status
+            row['status_r'] = record_r.status
+        else:
+            # 未追踪的帧没有位移数据（缓冲区会被复用，必须覆盖）：位移记为 NaN，
+            # 以免被条件查询当作静止的追踪帧；有效标记和追踪状态记为 False
+            for name in ('mean_dx_l', 'mean_dy_l', 'mean_total_l', 'mean_dx_r', 'mean_dy_r',
+                         'mean_total_r', 'field_l', 'field_r'):
+                row[name] = np.nan
+            for name in ('valid_l', 'valid_r', 'status_l', 'status_r'):
+                row[name] = False
+
+        row['contact'] = outputs.get('contact', -1)
+        x_slip, y_slip = outputs.get('slip', (-1, -1))
+        row['x_slip'] = x_slip
+        row['y_slip'] = y_slip
+        row['rolling'] = outputs.get('scroll', -1)
+        row['disturbance'] = outputs.get('disturbance', -1)
+        row['liquid'] = outputs.get('weight', np.nan)
+        (row['gripper_status'], row['gripper_current'], row['gripper_speed'],
+         row['gripper_time']) = self.gripper_snapshot
+        row['frame_index'] = frame_index
+        self.rows.commit(self._write_queue)
+
+    @property
+    def dropped(self):
+        """因写入跟不上而丢弃的 (记录行数, 图像帧数)"""
+        return (self.rows.dropped if self.rows is not None else 0,
+                self.frames.dropped if self.frames is not None else 0)
+
+    def close(self, timeout=10.0):
+        """写出未满的 chunk，等待写入线程结束"""
+        for stream in (self.rows, self.frames):
+            if stream is not None:
+                stream.flush(self._write_queue)
+        if self._thread is not None:
+            self._write_queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+        else:
+            # 未启动写入线程时在当前线程写出
+            self._write_queue.put(None)
+            self._writer()
+        rows, frames = self.dropped
+        if rows or frames:
+            print(f"会话记录丢弃了 {rows} 行记录、{frames} 帧图像（磁盘写入跟不上）")
+
+
+class RecordedSession:
+    """
+    以内存映射方式打开的会话记录，rows 和 frames 的切片都不拷贝数据
+    """
+    def __init__(self, path):
+        self.path = path
+        self.header, self.rows = open_memmap(path)
+        self.states = self.header.get('states', [])
+        self.chunk_rows = self.header.get('chunk_rows', 256)
+        self.frames = None
+        if os.path.exists(path + FRAMES_SUFFIX):
+            _, self.frames = open_memmap(path + FRAMES_SUFFIX)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def state_names(self, rows=None):
+        """记录行的状态名列表"""
+        codes = self.rows['state'] if rows is None else rows['state']
+        return [self.states[c] if c < len(self.states) else None for c in codes]
+
+    def frame(self, row):
+        """某一行对应的 (左, 右) 原始图像，未保存时返回 None"""
+        index = int(row['frame_index'])
+        if self.frames is None or index < 0 or index >= len(self.frames):
+            return None
+        return self.frames[index]
+
+
+def load_session(path):
+    return RecordedSession(path)
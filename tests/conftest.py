@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模块都位于仓库根目录（非安装包），测试时加入导入路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,31 @@
+import tracemalloc
+import pytest
+
+pytest.importorskip('utilities.marker_tracker')
+
+from frame_source import FrameSource, SyntheticMarkerSource
+from gelsightmini import DisplacementTracker
+
+
+@pytest.mark.parametrize('predictor', [None, 'constant_velocity', 'kalman'])
+def test_buffer_pool_track_allocates_no_large_arrays(predictor):
+    """buffer_pool 模式下稳态的 track() 不分配灰度图大小的数组"""
+    source = SyntheticMarkerSource(motion='shear_x')
+    frames = [source.update(1 / 30.0) for _ in range(60)]
+    tracker = DisplacementTracker(source=FrameSource(), buffer_pool=True, predictor=predictor)
+    tracker.initialize(frames[0], source.marker_centers)
+    for frame in frames[1:10]:
+        tracker.track(frame)
+
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for frame in frames[10:]:
+            record = tracker.track(frame)
+            assert record.valid
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    frame_bytes = frames[0].shape[0] * frames[0].shape[1]
+    assert peak - start < frame_bytes // 2
@@ -0,0 +1,91 @@
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('utilities.marker_tracker')
+
+from capture import FrameGrabber
+from frame_source import FrameSource, SyntheticMarkerSource
+from GSmini import GSmini
+
+
+class PacedCamera(FrameSource):
+    """按固定周期出帧的模拟相机，帧序号写在左上角像素中"""
+    live = True
+
+    def __init__(self, frame, period, phase=0.0):
+        self.frame = frame
+        self.period = period
+        self.phase = phase
+        self.next_time = None
+        self.count = 0
+
+    def update(self, dt):
+        now = time.monotonic()
+        if self.next_time is None:
+            self.next_time = now + self.phase
+        if self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time += self.period
+        self.count += 1
+        frame = self.frame.copy()
+        frame[0, 0, 0] = self.count % 256
+        return frame
+
+
+def test_threaded_capture_never_repeats_frames():
+    """两路相机相差半个周期时，进入位移历史的每一帧都是新帧"""
+    source = SyntheticMarkerSource()
+    frame = source.render(np.zeros_like(source.origin))
+    period = 1 / 30.0
+    gsmini = GSmini(window=60, keep_frames=True, threaded_capture=True, warmup_frames=0,
+                    source_l=PacedCamera(frame, period),
+                    source_r=PacedCamera(frame, period, phase=period / 2))
+    try:
+        gsmini.initialize(source.marker_centers, source.marker_centers)
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            assert gsmini.get_frame()
+    finally:
+        gsmini.close()
+
+    for history in (gsmini.displacement_history_l, gsmini.displacement_history_r):
+        n = len(history)
+        assert n > 10
+        seqs = [int(f[0, 0, 0]) for f in history.frames]
+        assert len(seqs) == n
+        assert np.all(np.diff(seqs) > 0)
+        assert np.all(np.diff(history.recent('timestamp', n)) > 0)
+
+
+class EmptySource(FrameSource):
+    """始终没有图像的来源，记录 update() 的调用次数"""
+    live = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def update(self, dt):
+        self.calls += 1
+        return None
+
+
+def test_grabber_backs_off_without_frames():
+    source = EmptySource()
+    grabber = FrameGrabber(source, dt=0.02)
+    grabber.start()
+    time.sleep(0.2)
+    grabber.stop()
+    assert source.calls <= 20
+
+
+def test_threaded_capture_rejects_non_live_sources():
+    with pytest.raises(ValueError):
+        GSmini(threaded_capture=True, source_l=SyntheticMarkerSource(), source_r=SyntheticMarkerSource())
+
+
+def test_initialize_raises_when_no_frames():
+    gsmini = GSmini(source_l=EmptySource(), source_r=EmptySource())
+    gsmini.INIT_READ_TIMEOUT = 0.1
+    with pytest.raises(RuntimeError):
+        gsmini.initialize()
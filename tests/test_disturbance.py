@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('utilities.marker_tracker')
+
+from frame_source import SyntheticMarkerSource
+from gelsightmini import DisplacementRecord
+from GSmini import GSmini
+
+NCT = 40
+
+
+def make_gsmini(disturbance_frames):
+    return GSmini(window=10, disturbance_frames=disturbance_frames,
+                  source_l=SyntheticMarkerSource(), source_r=SyntheticMarkerSource())
+
+
+def push(gsmini, field_l, valid_l, field_r, valid_r):
+    """跳过光流，直接写入左右两侧的位移记录"""
+    record_l = DisplacementRecord(np.zeros((NCT, 2), np.float32), field_l, np.ones(NCT, bool), valid_l)
+    record_r = DisplacementRecord(np.zeros((NCT, 2), np.float32), field_r, np.ones(NCT, bool), valid_r)
+    gsmini.displacement_history_l.append(record_l)
+    gsmini.displacement_history_r.append(record_r)
+    gsmini.mean_field_l.update(record_l.field, record_l.valid)
+    gsmini.mean_field_r.update(record_r.field, record_r.valid)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_fallback_matches_running_path(seed):
+    """从位移历史计算的结果与滑动均值一致：每个传感器各自跳过自己追踪失败的帧"""
+    rng = np.random.default_rng(seed)
+    running = make_gsmini(disturbance_frames=5)
+    fallback = make_gsmini(disturbance_frames=3)
+    n_checked = 0
+    for _ in range(60):
+        fields = rng.normal(0, 0.4, (2, NCT, 2)).astype(np.float32)
+        valid = rng.random(2) > 0.3
+        for gsmini in (running, fallback):
+            push(gsmini, fields[0], valid[0], fields[1], valid[1])
+        if running.mean_field_l.ready:
+            assert fallback.identify_disturbance(0.5, n_frames=5) == running.identify_disturbance(0.5)
+            n_checked += 1
+    assert n_checked > 50
+
+
+def test_fallback_ignores_other_sensor_invalid_frames():
+    gsmini = make_gsmini(disturbance_frames=3)
+    still = np.zeros((NCT, 2), np.float32)
+    # 左侧所有历史帧有效，右侧历史帧全部追踪失败；左右逐帧取交集时将没有任何有效历史帧
+    for _ in range(5):
+        push(gsmini, still, True, still, False)
+    push(gsmini, np.ones((NCT, 2), np.float32), True, still, True)
+    assert gsmini.identify_disturbance(0.5, n_frames=5) is False  # 右侧没有有效历史帧，无法判断
+
+    gsmini = make_gsmini(disturbance_frames=3)
+    for i in range(5):
+        push(gsmini, still, True, still, i % 2 == 0)
+    push(gsmini, np.ones((NCT, 2), np.float32), True, still, True)
+    assert gsmini.identify_disturbance(0.5, n_frames=5)
+
+
+def test_fallback_window_longer_than_history_returns_false():
+    gsmini = make_gsmini(disturbance_frames=3)
+    still = np.zeros((NCT, 2), np.float32)
+    for _ in range(15):
+        push(gsmini, still, True, still, True)
+    push(gsmini, np.ones((NCT, 2), np.float32), True, still, True)
+    assert gsmini.identify_disturbance(0.5, n_frames=5)
+    assert gsmini.identify_disturbance(0.5, n_frames=10) is False
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+
+import frame_source
+from frame_source import ReplaySource
+
+
+def test_realtime_replay_follows_recorded_timestamps(tmp_path, monkeypatch):
+    path = str(tmp_path / 'replay.npz')
+    frames = np.zeros((4, 8, 8, 3), dtype=np.uint8)
+    timestamps = np.array([100.0, 100.05, 100.25, 100.30])
+    np.savez(path, frames=frames, timestamps=timestamps)
+
+    waits = []
+    monkeypatch.setattr(frame_source.time, 'sleep', waits.append)
+    source = ReplaySource(path, realtime=True, fps=30.0)
+    np.testing.assert_array_equal(source.timestamps, timestamps)
+    for _ in range(4):
+        assert source.update(0) is not None
+    assert source.update(0) is None
+
+    # 第一帧不等待，之后按相邻帧的录制间隔等待（读取本身耗时可忽略）
+    np.testing.assert_allclose(waits[:3], [0.05, 0.20, 0.05], atol=0.01)
+
+
+def test_realtime_replay_without_timestamps_uses_fps(tmp_path, monkeypatch):
+    path = str(tmp_path / 'replay.npz')
+    np.savez(path, frames=np.zeros((3, 8, 8, 3), dtype=np.uint8))
+
+    waits = []
+    monkeypatch.setattr(frame_source.time, 'sleep', waits.append)
+    source = ReplaySource(path, realtime=True, fps=20.0)
+    for _ in range(3):
+        source.update(0)
+    np.testing.assert_allclose(waits, [0.05, 0.05], atol=0.01)
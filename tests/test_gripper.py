@@ -0,0 +1,66 @@
+import threading
+import pytest
+
+pytest.importorskip('serial')
+
+from gripper import GripperCommandQueue
+
+
+class RecordingGripper:
+    """记录命令执行顺序；状态读取阻塞到 unblock 被置位，用来让后续命令在队列中排队"""
+    def __init__(self):
+        self.commands = []
+        self.busy = threading.Event()
+        self.unblock = threading.Event()
+
+    def read_status_snapshot(self):
+        self.busy.set()
+        self.unblock.wait(2.0)
+        self.commands.append('status')
+
+    def grip(self):
+        self.commands.append('grip')
+        return True
+
+    def release(self):
+        self.commands.append('release')
+        return True
+
+    def set_grip_current(self, current):
+        self.commands.append('config')
+        return True
+
+
+def test_release_cancels_queued_grip():
+    gripper = RecordingGripper()
+    io = GripperCommandQueue(gripper)
+    io.start()
+    try:
+        io.read_status_snapshot()
+        assert gripper.busy.wait(2.0)
+        config = io.set_grip_current(100)
+        grip = io.grip()
+        release = io.release()
+        gripper.unblock.set()
+        assert release.result(2.0) is True
+        assert config.result(2.0) is True
+    finally:
+        io.stop()
+
+    assert grip.cancelled()
+    assert 'grip' not in gripper.commands
+    # 松开仍然插到排队中的配置写入之前
+    assert gripper.commands == ['status', 'release', 'config']
+
+
+def test_grip_after_release_still_runs():
+    gripper = RecordingGripper()
+    gripper.unblock.set()
+    io = GripperCommandQueue(gripper)
+    io.start()
+    try:
+        io.release().result(2.0)
+        assert io.grip().result(2.0) is True
+    finally:
+        io.stop()
+    assert gripper.commands == ['release', 'grip']
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('utilities.marker_tracker')
+
+from frame_source import FrameSource, SyntheticMarkerSource
+from gelsightmini import DisplacementTracker
+
+
+@pytest.fixture
+def frame_and_cache(tmp_path):
+    source = SyntheticMarkerSource()
+    frame = source.render(np.zeros_like(source.origin))
+    tracker = DisplacementTracker(source=FrameSource())
+    tracker.initialize(frame, source.marker_centers)
+    path = str(tmp_path / 'markers.npz')
+    tracker.save_initialization(path)
+    return frame, path
+
+
+def test_valid_cache_restores(frame_and_cache):
+    frame, path = frame_and_cache
+    assert DisplacementTracker(source=FrameSource()).load_initialization(path, frame)
+
+
+def test_truncated_cache_falls_back(frame_and_cache):
+    frame, path = frame_and_cache
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    assert not DisplacementTracker(source=FrameSource()).load_initialization(path, frame)
+
+
+def test_malformed_marker_centers_fall_back(frame_and_cache):
+    frame, path = frame_and_cache
+    with np.load(path) as data:
+        contents = dict(data)
+    contents['marker_centers'] = contents['marker_centers'].ravel()
+    with open(path, 'wb') as f:
+        np.savez(f, **contents)
+    assert not DisplacementTracker(source=FrameSource()).load_initialization(path, frame)
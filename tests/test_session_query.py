@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('utilities.marker_tracker')
+
+from frame_source import SyntheticMarkerSource
+from GSmini import GSmini
+from session_query import SessionIndex, mask_windows
+from session_recorder import SessionRecorder, load_session
+
+
+def record_session(path):
+    """录制一段追踪帧与未追踪帧交替的会话：每 20 帧中前 8 帧只做接触预检测"""
+    # 静止的标记点：接触预检测不会触发，追踪帧的平均位移接近 0
+    source_l = SyntheticMarkerSource(noise=1, seed=0)
+    source_r = SyntheticMarkerSource(noise=1, seed=1)
+    gsmini = GSmini(source_l=source_l, source_r=source_r, contact_gate=True)
+    gsmini.initialize(source_l.marker_centers, source_r.marker_centers)
+    recorder = SessionRecorder(path, states=['WAITING', 'GRIPPING'], chunk_rows=16)
+    recorder.start()
+    for k in range(160):
+        gsmini.get_frame(track=k % 20 >= 8)
+        gsmini.judge_contact()
+        recorder.record(gsmini, 'GRIPPING')
+    recorder.close()
+
+
+def test_untracked_frames_are_excluded_from_queries(tmp_path):
+    path = str(tmp_path / 'session.gss')
+    record_session(path)
+    rows = np.asarray(load_session(path).rows)
+    tracked = rows['tracked']
+    assert tracked.any() and not tracked.all()
+
+    # 未追踪帧没有位移数据，有效标记和追踪状态为 False
+    assert np.isnan(rows['mean_total_l'][~tracked]).all()
+    assert np.isnan(rows['field_r'][~tracked]).all()
+    assert not rows['valid_l'][~tracked].any()
+    assert not rows['status_r'][~tracked].any()
+    assert np.isfinite(rows['mean_total_l'][tracked]).all()
+
+    index = SessionIndex(path)
+    windows = index.where('mean_total_l', '<', 0.1)
+    assert windows
+    assert windows == mask_windows(tracked & (rows['mean_total_l'] < 0.1))
+    for start, stop in windows:
+        assert tracked[start:stop].all()
+
+    # 索引的最小/最大值只来自追踪帧
+    assert index.chunks['mean_total_l_max'].max() == rows['mean_total_l'][tracked].max()
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('utilities.marker_tracker')
+
+from frame_source import SyntheticMarkerSource
+from GSmini import GSmini
+
+
+def run(width_r, height_r, **kwargs):
+    """左右传感器分辨率不同，返回每帧左右位移场"""
+    source_l = SyntheticMarkerSource(motion='rotate', amplitude=3, period=40, noise=1, seed=0)
+    source_r = SyntheticMarkerSource(width=width_r, height=height_r, motion='shear_y', amplitude=3,
+                                     period=40, noise=1, seed=1)
+    gsmini = GSmini(source_l=source_l, source_r=source_r, warmup_frames=0, **kwargs)
+    gsmini.initialize(source_l.marker_centers, source_r.marker_centers)
+    fields = []
+    try:
+        for _ in range(20):
+            gsmini.get_frame()
+            record_l, record_r = gsmini.last_records
+            fields.append((record_l.field.copy(), record_r.field.copy()))
+    finally:
+        gsmini.close()
+    return fields
+
+
+def test_process_pool_with_different_frame_shapes():
+    expected = run(400, 300)
+    result = run(400, 300, process_pool=True)
+    for (field_l, field_r), (pool_l, pool_r) in zip(expected, result):
+        np.testing.assert_allclose(pool_l, field_l, atol=1e-5)
+        np.testing.assert_allclose(pool_r, field_r, atol=1e-5)
+
+
+def test_process_pool_rejects_combined_lk():
+    with pytest.raises(ValueError):
+        GSmini(process_pool=True, combined_lk=True,
+               source_l=SyntheticMarkerSource(), source_r=SyntheticMarkerSource())
@@ -0,0 +1,95 @@
+"""
+向量化的标记点计算与原始逐点循环实现（参考实现保留在本文件中）的一致性，
+以及批量处理 process_sequence 与逐帧 track() 的一致性
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip('utilities.marker_tracker')
+
+from frame_source import FrameSource, SyntheticMarkerSource
+from gelsightmini import DisplacementTracker
+
+
+def reference_p0(Ox, Oy, nct):
+    """原实现: 逐点 np.append 构造追踪点"""
+    p0 = np.array([[Ox[0], Oy[0]]], np.float32).reshape(-1, 1, 2)
+    for i in range(nct - 1):
+        new_point = np.array([[Ox[i + 1], Oy[i + 1]]], np.float32).reshape(-1, 1, 2)
+        p0 = np.append(p0, new_point, axis=0)
+    return p0
+
+
+def reference_displacements(Ox, Oy, current_points):
+    """原实现: calculate_displacements"""
+    displacements = []
+    for i in range(len(current_points)):
+        dx = current_points[i][0] - Ox[i]
+        dy = current_points[i][1] - Oy[i]
+        displacement = np.sqrt(dx**2 + dy**2)
+        displacements.append(displacement)
+    return np.array(displacements)
+
+
+def reference_directional_displacements(Ox, Oy, current_points):
+    """原实现: calculate_directional_displacements"""
+    dx_list = []
+    dy_list = []
+    for i in range(len(current_points)):
+        dx = current_points[i][0] - Ox[i]
+        dy = current_points[i][1] - Oy[i]
+        dx_list.append(dx)
+        dy_list.append(dy)
+    return np.array(dx_list), np.array(dy_list)
+
+
+# 初始位置以 float32 保存（与原实现的追踪点一致）；
+# float64 的标记点中心在 320 像素范围内舍入后约有 2e-5 像素的误差
+@pytest.mark.parametrize('dtype, atol', [(np.float32, 1e-5), (np.float64, 1e-4)])
+@pytest.mark.parametrize('seed', range(5))
+def test_vectorized_matches_reference(dtype, atol, seed):
+    rng = np.random.default_rng(seed)
+    nct = int(rng.integers(1, 100))
+    marker_centers = np.column_stack([rng.uniform(0, 240, nct), rng.uniform(0, 320, nct)]).astype(dtype)
+    tracker = DisplacementTracker(source=FrameSource())
+    tracker.initialize(np.zeros((240, 320, 3), dtype=np.uint8), marker_centers)
+    Ox, Oy = marker_centers[:, 1], marker_centers[:, 0]
+
+    np.testing.assert_array_equal(tracker.p0, reference_p0(Ox, Oy, nct))
+
+    current_points = (marker_centers[:, ::-1] + rng.normal(0, 3, (nct, 2))).astype(np.float32)
+    np.testing.assert_allclose(tracker.calculate_displacements(current_points),
+                               reference_displacements(Ox, Oy, current_points), rtol=0, atol=atol)
+    dx, dy = tracker.calculate_directional_displacements(current_points)
+    ref_dx, ref_dy = reference_directional_displacements(Ox, Oy, current_points)
+    np.testing.assert_allclose(dx, ref_dx, rtol=0, atol=atol)
+    np.testing.assert_allclose(dy, ref_dy, rtol=0, atol=atol)
+
+
+@pytest.mark.parametrize('mode', [{}, dict(buffer_pool=True), dict(predictor='kalman'),
+                                  dict(partial_tracking=True)])
+def test_process_sequence_matches_track(tmp_path, mode):
+    """批量处理（块长度小于序列长度）与逐帧 track() 的结果逐帧一致"""
+    source = SyntheticMarkerSource(motion='rotate', amplitude=3, period=20, noise=1, seed=0)
+    path = str(tmp_path / 'frames.npy')
+    frames = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(30, 240, 320, 3))
+    for i in range(len(frames)):
+        frames[i] = source.update(0)
+    frames.flush()
+    frames = np.load(path, mmap_mode='r')
+
+    tracker = DisplacementTracker(source=FrameSource(), **mode)
+    tracker.initialize(np.asarray(frames[0]), source.marker_centers)
+    expected_fields, expected_status = [], []
+    for frame in frames:
+        # buffer_pool 模式下记录会复用缓冲区，逐帧拷贝
+        record = tracker.track(np.asarray(frame))
+        expected_fields.append(record.field.copy())
+        expected_status.append(record.status.copy())
+
+    batch = DisplacementTracker(source=FrameSource(), **mode)
+    fields, status = batch.process_sequence(frames, chunk_size=7, threads=2,
+                                            marker_centers=source.marker_centers)
+    assert np.abs(fields).max() > 1.0
+    np.testing.assert_array_equal(fields, np.stack(expected_fields))
+    np.testing.assert_array_equal(status, np.stack(expected_status))
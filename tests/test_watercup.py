@@ -0,0 +1,31 @@
+import time
+from concurrent.futures import Future
+import pytest
+
+pytest.importorskip('utilities.marker_tracker')
+
+from instrumentation import Tracer
+from watercup_main import WatercupStateMachine
+
+
+class FakeGSmini:
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+
+def test_release_trace_counts_only_acknowledged_releases():
+    tracer = Tracer()
+    state_machine = WatercupStateMachine(FakeGSmini(tracer), gripper_io=None)
+    for outcome in (True, False, RuntimeError('serial timeout')):
+        tracer.begin_frame(time.time())
+        future = Future()
+        state_machine.trace_release(future)
+        if isinstance(outcome, Exception):
+            future.set_exception(outcome)
+        else:
+            future.set_result(outcome)
+
+    summary = tracer.summary()
+    assert summary['slip_to_release.decision']['count'] == 3
+    assert summary['slip_to_release.ack']['count'] == 1
+    assert summary['slip_to_release.failed']['count'] == 2
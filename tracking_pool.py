@@ -0,0 +1,232 @@
+"""
+多进程标记点追踪
+
+每个传感器的 DisplacementTracker 运行在各自的工作进程中，
+图像帧和追踪结果都通过 multiprocessing.shared_memory 中的环形槽位传递，不经过 pickle；
+进程间只用管道传递槽位编号等少量控制信息。多个传感器的光流追踪因此可以同时占用多个 CPU 核。
+
+用法:
+    pool = TrackingPool(n_sensors=2, frame_shape=(240, 320, 3))
+    pool = TrackingPool(n_sensors=2, frame_shape=[frame_l.shape, frame_r.shape])  # 左右分辨率不同时
+    pool.start()
+    pool.initialize(0, frame_l)
+    pool.initialize(1, frame_r)
+    record_l, record_r = pool.track_all([frame_l, frame_r])
+    pool.stop()
+"""
+import multiprocessing as mp
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+from frame_source import FrameSource
+from gelsightmini import DisplacementRecord, DisplacementTracker
+
+
+class SharedRing:
+    """共享内存中的固定槽位数组, shape: (slots, *shape)"""
+    def __init__(self, slots, shape, dtype, name=None):
+        """
+        :param name: 已有共享内存的名称；未提供时新建
+        """
+        self.shape = (slots,) + tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def spec(self):
+        """在其他进程中重新打开所需的参数"""
+        return self.shape[0], self.shape[1:], self.dtype.str, self.name
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def worker_main(conn, frame_spec, result_specs, tracker_kwargs):
+    """
+    工作进程：按槽位编号从共享内存读取图像帧并追踪，结果写回共享内存
+    消息格式（主进程 -> 工作进程）:
+        ('init', slot, marker_centers, cache_path)  用该槽位的图像初始化
+        ('track', slot)                 追踪该槽位的图像
+        None                            退出
+    """
+    frames = SharedRing(*frame_spec)
+    points, fields, status, valid = (SharedRing(*spec) for spec in result_specs)
+    tracker = DisplacementTracker(source=FrameSource(), **tracker_kwargs)
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+
+            command, slot = message[0], message[1]
+            if command == 'init':
+                try:
+                    tracker.initialize(frames.array[slot], message[2], message[3])
+                except Exception as e:
+                    conn.send(('error', repr(e)))
+                    continue
+                if tracker.nct > points.shape[1]:
+                    conn.send(('error', f"标记点数量 {tracker.nct} 超过 max_markers {points.shape[1]}"))
+                    continue
+                conn.send(('ready', tracker.origin))
+            elif command == 'track':
+                try:
+                    record = tracker.track(frames.array[slot])
+                except Exception as e:
+                    conn.send(('error', repr(e)))
+                    continue
+                nct = tracker.nct
+                points.array[slot, :nct] = record.points
+                fields.array[slot, :nct] = record.field
+                status.array[slot, :nct] = record.status
+                valid.array[slot] = record.valid
+                conn.send(('done', slot))
+    finally:
+        for ring in (frames, points, fields, status, valid):
+            ring.close()
+
+
+class SensorWorker:
+    """主进程中一个传感器工作进程的句柄，持有该传感器的共享内存槽位"""
+    def __init__(self, ctx, frame_shape, slots, max_markers, tracker_kwargs, name=None):
+        self.slots = slots
+        self.frames = SharedRing(slots, frame_shape, np.uint8)
+        self.points = SharedRing(slots, (max_markers, 2), np.float32)
+        self.fields = SharedRing(slots, (max_markers, 2), np.float32)
+        self.status = SharedRing(slots, (max_markers,), bool)
+        self.valid = SharedRing(slots, (), bool)
+
+        self.conn, child_conn = ctx.Pipe()
+        result_specs = [ring.spec() for ring in (self.points, self.fields, self.status, self.valid)]
+        self.process = ctx.Process(target=worker_main, name=name, daemon=True,
+                                   args=(child_conn, self.frames.spec(), result_specs, tracker_kwargs))
+        self.nct = 0
+        self.origin = None
+        self.next_slot = 0
+        self.pending = deque()      # 已提交、尚未取回结果的 (槽位, 时间戳)
+        self.completed = deque()    # 因槽位用尽而提前取回的结果
+
+    def receive(self):
+        reply = self.conn.recv()
+        if reply[0] == 'error':
+            raise RuntimeError(f"追踪进程出错: {reply[1]}")
+        return reply
+
+    def write_frame(self):
+        """返回下一个空闲槽位；槽位全部占用时先取回最早的结果"""
+        if len(self.pending) >= self.slots:
+            self.completed.append(self.collect())
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.slots
+        return slot
+
+    def collect(self):
+        """取回最早提交的一帧结果（拷贝出共享内存，槽位随后可被复用）"""
+        slot, timestamp = self.pending.popleft()
+        _, done_slot = self.receive()
+        assert done_slot == slot
+        nct = self.nct
+        return DisplacementRecord(self.points.array[slot, :nct].copy(),
+                                  self.fields.array[slot, :nct].copy(),
+                                  self.status.array[slot, :nct].copy(),
+                                  bool(self.valid.array[slot]),
+                                  timestamp)
+
+    def close(self):
+        for ring in (self.frames, self.points, self.fields, self.status, self.valid):
+            ring.close()
+
+
+class TrackingPool:
+    """
+    每个传感器一个工作进程的追踪后端。
+    submit() 将图像拷贝进共享内存槽位后立即返回，result() 按提交顺序取回 DisplacementRecord；
+    同一传感器最多有 slots 帧同时在处理中，超过时 submit() 会先等待最早的一帧完成。
+    """
+    def __init__(self, n_sensors, frame_shape, slots=4, max_markers=256, start_method=None,
+                 **tracker_kwargs):
+        """
+        :param n_sensors: 传感器数量
+        :param frame_shape: 图像形状 (H, W, 3)，所有传感器相同；或每个传感器各自的形状列表
+        :param slots: 每个传感器的环形槽位数
+        :param max_markers: 每个传感器的最大标记点数量（结果槽位大小）
+        :param start_method: multiprocessing 启动方式，默认使用平台默认值
+        :param tracker_kwargs: 传给 DisplacementTracker 的其他参数（例如 predictor、partial_tracking）
+        """
+        if isinstance(frame_shape[0], (int, np.integer)):
+            frame_shape = [frame_shape] * n_sensors
+        if len(frame_shape) != n_sensors:
+            raise ValueError(f"frame_shape 数量 {len(frame_shape)} 与传感器数量 {n_sensors} 不一致")
+        # 每个传感器的图像槽位按各自的图像形状分配
+        self.frame_shapes = [tuple(shape) for shape in frame_shape]
+        ctx = mp.get_context(start_method)
+        self.workers = [
+            SensorWorker(ctx, shape, slots, max_markers, tracker_kwargs, name=f'tracker-{i}')
+            for i, shape in enumerate(self.frame_shapes)
+        ]
+
+    def start(self):
+        for worker in self.workers:
+            worker.process.start()
+
+    def stop(self, timeout=2.0):
+        for worker in self.workers:
+            if worker.process.is_alive():
+                worker.conn.send(None)
+        for worker in self.workers:
+            if worker.process.pid is not None:
+                worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.close()
+
+    def initialize(self, sensor, frame, marker_centers=None, cache_path=None):
+        """
+        用第一帧图像初始化指定传感器的追踪器（阻塞直到完成）
+        :param marker_centers, cache_path: 同 DisplacementTracker.initialize
+        :return: 标记点数量
+        """
+        worker = self.workers[sensor]
+        while worker.pending:
+            worker.collect()
+        worker.completed.clear()
+
+        slot = worker.write_frame()
+        worker.frames.array[slot] = frame
+        worker.conn.send(('init', slot, marker_centers, cache_path))
+        _, origin = worker.receive()
+        worker.origin = origin
+        worker.nct = len(origin)
+        return worker.nct
+
+    def submit(self, sensor, frame, timestamp=None):
+        """提交一帧图像，立即返回"""
+        worker = self.workers[sensor]
+        slot = worker.write_frame()
+        worker.frames.array[slot] = frame
+        worker.pending.append((slot, timestamp))
+        worker.conn.send(('track', slot))
+
+    def result(self, sensor):
+        """按提交顺序取回指定传感器的下一帧 DisplacementRecord（阻塞直到完成）"""
+        worker = self.workers[sensor]
+        if worker.completed:
+            return worker.completed.popleft()
+        return worker.collect()
+
+    def track_all(self, frames, timestamps=None):
+        """所有传感器各提交一帧并等待全部完成，各传感器并行追踪"""
+        if timestamps is None:
+            timestamps = [None] * len(frames)
+        for sensor, (frame, timestamp) in enumerate(zip(frames, timestamps)):
+            self.submit(sensor, frame, timestamp)
+        return [self.result(sensor) for sensor in range(len(frames))]
@@ -1,183 +1,262 @@
 import time
-from collections import deque
-from gripper import ElectricGripperController
-from gelsightmini import DisplacementTracker
-from GSmini import GSmini
+from bringup import bring_up
+from gripper import GripperCommandQueue
+from instrumentation import Tracer, traced
+from scheduler import TickScheduler
+from session_recorder import SessionRecorder
 
 
-def main():
-      pass
-
-def set_state(new_state):
-    if new_state in VALID_STATES:
-        global state
-        state = new_state
-        print('='*60)
-        print(f'current state: {state}')
-        print('='*60)
-    else:
-        raise ValueError(f"无效状态：{new_state}")
-
-if __name__ == '__main__':
-      # 创建触觉实例并初始化
-      gsmini = GSmini()
-      gsmini.initialize()
-
-      # 创建控制器实例
-      initial_force = 1000  # 设置初始夹持力
-      gripper = ElectricGripperController(port='COM3', baudrate=115200, slave_id=1)
-      gripper.connect()
-      gripper.test_connection()
-      gripper.set_control_mode(1)          # 设置为串口控制
-      gripper.set_grip_current(initial_force)       # 设置夹持力
-      gripper.set_grip_speed(2000)         # 设置夹持速度
-      gripper.release()                    # 松开夹持
-      gripper.save_config()                # 保存设置
-      
-
-      # 维护状态变量
-      gripping = False
-      contact_stable_count = 0  # 稳定接触计数
-      no_contact_stable_count = 0  # 无接触稳定计数
-      slip_recovery_count = 0  # 滑移恢复计数
-      weight_monitor_count = 0  # 液量监测计数器
+class WatercupStateMachine:
+      """
+      水杯抓取状态机。
+      每个节拍由调度器调用 step()，原先在循环中的 time.sleep 等待
+      改为带截止时间的状态（VALIDATING、COOLDOWN），等待期间依然逐帧读取传感器。
+      """
       STABLE_THRESHOLD = 3  # 需要连续2帧稳定才改变状态
       RECOVERY_THRESHOLD = 5  # 滑移后恢复的等待帧数
-      GRIP_VALIDATION_FRAMES = 15  # 夹紧后验证帧数
+      GRIP_SETTLE_TIME = 1.0  # 夹紧后等待稳定的时间(秒)
+      GRIP_VALIDATION_TIME = 1.5  # 夹紧稳定后验证是否夹到物体的时间(秒)
+      RELEASE_SETTLE_TIME = 0.5  # 夹紧失败松开后的等待时间(秒)
+      SLIP_COOLDOWN_TIME = 2.0  # x方向滑移松开后的等待时间(秒)
       WEIGHT_MONITOR_FRAMES = 30  # 液量监测间隔帧数(约1秒)
-      VALID_STATES = {"WAITING", "GRIPPING"}
-      state = "WAITING"
-      last_slip_time = 0  # 记录上次滑移时间
-      y_slip_warning_count = 0
       MAX_Y_SLIP_WARNING = 5  # 最大警告次数，防止频繁打印
       MAX_DISTURBANCE_WARNING = 5  # 最大警告次数，防止频繁打印
       MAX_ROLLING_WARNING = 5  # 最大警告次数，防止频繁打印
+      VALID_STATES = {"WAITING", "VALIDATING", "GRIPPING", "COOLDOWN"}
+      GRIPPER_SNAPSHOT_FRAMES = 30  # 记录电爪寄存器快照的间隔帧数(约1秒)
 
-      # 读取位移，根据位移大小决定控制器输出
-      while True:
-            gsmini.get_frame()
-
-            if state == "WAITING":
-                  has_contact = gsmini.judge_contact()
-
-                  if has_contact:
-                        contact_stable_count += 1
-                        no_contact_stable_count = 0
-                        
-                        # 连续检测到接触且当前未夹紧时才开始夹紧
-                        # 增加条件：距离上次滑移要有足够的恢复时间
-                        if (contact_stable_count >= STABLE_THRESHOLD and 
-                        not gripping and 
-                        slip_recovery_count >= RECOVERY_THRESHOLD):
-                        
-                              # 执行夹紧动作
-                              gripping = True
-                              gripper.grip()
-                              time.sleep(1)  # 等待夹紧稳定
-                              
-                              # 夹紧后验证是否成功夹到物体
-                              grip_success = False
-                              for validation_frame in range(GRIP_VALIDATION_FRAMES):
-                                    gsmini.get_frame()  # 获取新的传感器数据
-                                    current_contact = gsmini.judge_contact()
-                                    
-                                    if current_contact:
-                                          grip_success = True
-                                          break
-                                    time.sleep(0.1)  # 短暂等待下一帧
-                              
-                              if grip_success:
-                                    # 夹紧成功，切换到GRIPPING状态
-                                    set_state("GRIPPING")
-                                    contact_stable_count = 0
-                                    slip_recovery_count = 0
-                                    weight_monitor_count = 0  # 重置液量监测计数器
-                                    print("Grip successful - switching to GRIPPING state")
-                              else:
-                                    # 夹紧失败，松开夹爪并保持在WAITING状态
-                                    print("Grip failed - nothing detected, releasing gripper")
-                                    gripping = False
-                                    gripper.release()
-                                    contact_stable_count = 0
-                                    slip_recovery_count = 0
-                                    time.sleep(0.5)  # 等待松开稳定
-                                    
-                  else:
-                        no_contact_stable_count += 1
-                        contact_stable_count = 0
-                        
-                        # 连续检测到无接触且当前已夹紧时才松开
-                        if no_contact_stable_count >= STABLE_THRESHOLD and gripping:
-                              gripping = False
-                              gripper.release()
-                              no_contact_stable_count = 0
-                              print("No contact detected - releasing gripper")
-                        
-                  # 在WAITING状态时增加恢复计数
-                  if slip_recovery_count < RECOVERY_THRESHOLD:
-                        slip_recovery_count += 1
-
-            elif state == "GRIPPING":
-                  is_rolling = gsmini.detect_scroll()
-                  rolling_warning_count = 0
-                  if is_rolling:
-                        if rolling_warning_count <= MAX_ROLLING_WARNING:
-                              print(f"[IS ROLLING] Waiting for stability!")
-                              rolling_warning_count = rolling_warning_count + 1
-                              continue
-
-                  x_direction_slip, y_direction_slip = gsmini.detect_slip()
-            
-                  # 连续检测到x方向滑移且当前夹紧时才开始放松
-                  if x_direction_slip and gripping:
-                        gripping = False
-                        gripper.release()
-                        set_state("WAITING")
-                        # 重置计数器，防止立即重新夹紧
-                        contact_stable_count = 0
-                        slip_recovery_count = 0
-                        last_slip_time = time.time()
-                        y_slip_warning_count = 0  # 重置y方向滑移警告计数
-                        print("X-direction slip detected - releasing and returning to WAITING")
-                        time.sleep(2)  # 等待稳定
-                  
-                  elif y_direction_slip:
-                        # 检测到y方向滑移，但首先判断是否为扰动
-                        is_disturbance = gsmini.identify_disturbance()
-                        
-                        if is_disturbance:
-                              print(f"[IS DISTURBANCE] Detected disturbance during y-slip, waiting for stability!")
-                              y_slip_warning_count = 0  # 重置警告计数，因为是扰动
-                        else:
-                              # 真正的滑移，需要警告，但限制频率
-                              y_slip_warning_count += 1
-                              if y_slip_warning_count <= MAX_Y_SLIP_WARNING:
-                                    print(f'[WARNING] Slipping! STOP ADDING WATER (Warning {y_slip_warning_count}/{MAX_Y_SLIP_WARNING})')
-                              elif y_slip_warning_count == MAX_Y_SLIP_WARNING + 1:
-                                    print('[WARNING] Continuous slipping detected, suppressing further warnings...')
-                                    # 将下次的夹持力增大50，将会再下一次松开再夹住的时候生效
-                                    gripper.set_grip_current(initial_force+50) 
-                                    print(f'[Set Gripper Current] Current Gripper Force: {initial_force+50}')
-                                    initial_force = initial_force + 50
-                        continue
-                  
+      def __init__(self, gsmini, gripper_io, initial_force=1000):
+            """
+            Args:
+                  gsmini: 已初始化的 GSmini
+                  gripper_io: 电爪异步命令队列 GripperCommandQueue
+                  initial_force: 初始夹持力
+            """
+            self.gsmini = gsmini
+            self.gripper_io = gripper_io
+            self.tracer = gsmini.tracer
+            self.initial_force = initial_force
+
+            # 维护状态变量
+            self.state = "WAITING"
+            self.state_deadline = None  # 定时状态的截止时刻
+            self.grip_validate_start = None  # 开始验证夹持的时刻
+            self.gripping = False
+            self.contact_stable_count = 0  # 稳定接触计数
+            self.no_contact_stable_count = 0  # 无接触稳定计数
+            self.slip_recovery_count = 0  # 滑移恢复计数
+            self.weight_monitor_count = 0  # 液量监测计数器
+            self.last_slip_time = 0  # 记录上次滑移时间
+            self.y_slip_warning_count = 0
+
+      def set_state(self, new_state, deadline=None):
+            if new_state not in self.VALID_STATES:
+                  raise ValueError(f"无效状态：{new_state}")
+            self.state = new_state
+            self.state_deadline = deadline
+            print('='*60)
+            print(f'current state: {self.state}')
+            print('='*60)
+
+      @traced('state.step')
+      def step(self, now):
+            """
+            执行一个节拍的状态判断（调用前已读取最新帧）
+            Args:
+                  now: 当前时刻（time.monotonic()）
+            """
+            if self.state == "WAITING":
+                  self.step_waiting(now)
+            elif self.state == "VALIDATING":
+                  self.step_validating(now)
+            elif self.state == "GRIPPING":
+                  self.step_gripping(now)
+            elif self.state == "COOLDOWN":
+                  # 等待稳定，期间不做判断
+                  if now >= self.state_deadline:
+                        self.set_state("WAITING")
+
+      def trace_release(self, future):
+            """
+            记录端到端延迟：从当前帧被采集到作出松开决定，以及到电爪确认松开命令。
+            松开命令失败（应答错误、超时或抛出异常）时记入 slip_to_release.failed，不计为确认
+            """
+            tracer = self.tracer
+            if tracer is None:
+                  return
+            trace_id, capture_time = tracer.trace_id, tracer.capture_time
+            tracer.record_from_capture('slip_to_release.decision', capture_time, trace_id)
+
+            def done(f):
+                  acknowledged = not f.cancelled() and f.exception() is None and f.result() is True
+                  stage = 'slip_to_release.ack' if acknowledged else 'slip_to_release.failed'
+                  tracer.record_from_capture(stage, capture_time, trace_id)
+            future.add_done_callback(done)
+
+      def step_waiting(self, now):
+            has_contact = self.gsmini.judge_contact()
+
+            if has_contact:
+                  self.contact_stable_count += 1
+                  self.no_contact_stable_count = 0
+
+                  # 连续检测到接触且当前未夹紧时才开始夹紧
+                  # 增加条件：距离上次滑移要有足够的恢复时间
+                  if (self.contact_stable_count >= self.STABLE_THRESHOLD and
+                  not self.gripping and
+                  self.slip_recovery_count >= self.RECOVERY_THRESHOLD):
+
+                        # 执行夹紧动作，等待夹紧稳定后在限定时间内验证是否夹到物体
+                        self.gripping = True
+                        self.gripper_io.grip()
+                        self.grip_validate_start = now + self.GRIP_SETTLE_TIME
+                        self.set_state("VALIDATING",
+                                       deadline=self.grip_validate_start + self.GRIP_VALIDATION_TIME)
+                        return
+
+            else:
+                  self.no_contact_stable_count += 1
+                  self.contact_stable_count = 0
+
+                  # 连续检测到无接触且当前已夹紧时才松开
+                  if self.no_contact_stable_count >= self.STABLE_THRESHOLD and self.gripping:
+                        self.gripping = False
+                        self.gripper_io.release()
+                        self.no_contact_stable_count = 0
+                        print("No contact detected - releasing gripper")
+
+            # 在WAITING状态时增加恢复计数
+            if self.slip_recovery_count < self.RECOVERY_THRESHOLD:
+                  self.slip_recovery_count += 1
+
+      def step_validating(self, now):
+            # 等待夹紧稳定
+            if now < self.grip_validate_start:
+                  return
+
+            # 夹紧后验证是否成功夹到物体
+            if self.gsmini.judge_contact():
+                  # 夹紧成功，切换到GRIPPING状态
+                  self.set_state("GRIPPING")
+                  self.contact_stable_count = 0
+                  self.slip_recovery_count = 0
+                  self.weight_monitor_count = 0  # 重置液量监测计数器
+                  print("Grip successful - switching to GRIPPING state")
+            elif now >= self.state_deadline:
+                  # 夹紧失败，松开夹爪并等待松开稳定后回到WAITING状态
+                  print("Grip failed - nothing detected, releasing gripper")
+                  self.gripping = False
+                  self.gripper_io.release()
+                  self.contact_stable_count = 0
+                  self.slip_recovery_count = 0
+                  self.set_state("COOLDOWN", deadline=now + self.RELEASE_SETTLE_TIME)
+
+      def step_gripping(self, now):
+            is_rolling = self.gsmini.detect_scroll()
+            rolling_warning_count = 0
+            if is_rolling:
+                  if rolling_warning_count <= self.MAX_ROLLING_WARNING:
+                        print(f"[IS ROLLING] Waiting for stability!")
+                        rolling_warning_count = rolling_warning_count + 1
+                        return
+
+            x_direction_slip, y_direction_slip = self.gsmini.detect_slip()
+
+            # 连续检测到x方向滑移且当前夹紧时才开始放松
+            if x_direction_slip and self.gripping:
+                  self.gripping = False
+                  self.trace_release(self.gripper_io.release())
+                  # 重置计数器，防止立即重新夹紧
+                  self.contact_stable_count = 0
+                  self.slip_recovery_count = 0
+                  self.last_slip_time = time.time()
+                  self.y_slip_warning_count = 0  # 重置y方向滑移警告计数
+                  print("X-direction slip detected - releasing and returning to WAITING")
+                  # 等待稳定后回到WAITING状态
+                  self.set_state("COOLDOWN", deadline=now + self.SLIP_COOLDOWN_TIME)
+
+            elif y_direction_slip:
+                  # 检测到y方向滑移，但首先判断是否为扰动
+                  is_disturbance = self.gsmini.identify_disturbance()
+
+                  if is_disturbance:
+                        print(f"[IS DISTURBANCE] Detected disturbance during y-slip, waiting for stability!")
+                        self.y_slip_warning_count = 0  # 重置警告计数，因为是扰动
                   else:
-                        # 没有检测到滑移，重置警告计数器
-                        y_slip_warning_count = 0
-                        
-                        # 检查是否有扰动
-                        is_disturbance = gsmini.identify_disturbance()
-                        
-                        if is_disturbance:
-                              print(f"[IS DISTURBANCE] Waiting for stability!")
-                              continue
-                        else: 
-                              # 当没有扰动，滑移或者滚动等紧急情况时，进行液量监测
-                              weight_monitor_count += 1
-                              if weight_monitor_count >= WEIGHT_MONITOR_FRAMES:
-                                    # 每30帧（约1秒）监测一次液量
-                                    current_weight = gsmini.perceive_weight()
-                                    print(f"[LIQUID MONITOR] Current liquid level: {current_weight}")
-                                    weight_monitor_count = 0  # 重置计数器
+                        # 真正的滑移，需要警告，但限制频率
+                        self.y_slip_warning_count += 1
+                        if self.y_slip_warning_count <= self.MAX_Y_SLIP_WARNING:
+                              print(f'[WARNING] Slipping! STOP ADDING WATER (Warning {self.y_slip_warning_count}/{self.MAX_Y_SLIP_WARNING})')
+                        elif self.y_slip_warning_count == self.MAX_Y_SLIP_WARNING + 1:
+                              print('[WARNING] Continuous slipping detected, suppressing further warnings...')
+                              # 将下次的夹持力增大50，将会再下一次松开再夹住的时候生效
+                              self.gripper_io.set_grip_current(self.initial_force+50)
+                              print(f'[Set Gripper Current] Current Gripper Force: {self.initial_force+50}')
+                              self.initial_force = self.initial_force + 50
+
             else:
-                  pass
\ No newline at end of file
+                  # 没有检测到滑移，重置警告计数器
+                  self.y_slip_warning_count = 0
+
+                  # 检查是否有扰动
+                  is_disturbance = self.gsmini.identify_disturbance()
+
+                  if is_disturbance:
+                        print(f"[IS DISTURBANCE] Waiting for stability!")
+                  else:
+                        # 当没有扰动，滑移或者滚动等紧急情况时，进行液量监测
+                        self.weight_monitor_count += 1
+                        if self.weight_monitor_count >= self.WEIGHT_MONITOR_FRAMES:
+                              # 每30帧（约1秒）监测一次液量
+                              current_weight = self.gsmini.perceive_weight()
+                              print(f"[LIQUID MONITOR] Current liquid level: {current_weight}")
+                              self.weight_monitor_count = 0  # 重置计数器
+
+
+def main():
+      # 并行启动触觉传感器和电爪：配置只读取一次，两路相机和电爪设置同时进行
+      # 各阶段延迟和滑移到松开的端到端延迟记录
+      tracer = Tracer()
+
+      initial_force = 1000  # 设置初始夹持力
+      gsmini, gripper, _ = bring_up(port='COM3', baudrate=115200, slave_id=1,
+                                    initial_force=initial_force, grip_speed=2000,
+                                    threaded_capture=True, contact_gate=True, tracer=tracer)
+
+      # 控制循环中的电爪命令交给专用I/O线程异步执行，不阻塞触觉处理
+      gripper_io = GripperCommandQueue(gripper, tracer=tracer)
+      gripper_io.start()
+
+      state_machine = WatercupStateMachine(gsmini, gripper_io, initial_force)
+
+      # 记录每帧的位移、检测结果、状态和电爪快照，写入由后台线程完成
+      recorder = SessionRecorder(time.strftime('session_%Y%m%d_%H%M%S.gss'),
+                                 states=sorted(WatercupStateMachine.VALID_STATES))
+      recorder.start()
+
+      def on_tick(now):
+            # 每个节拍都读取传感器数据，再进行状态判断
+            # 等待接触时由接触预检测决定是否需要完整追踪
+            if gsmini.get_frame(track=state_machine.state != "WAITING"):
+                  state_machine.step(now)
+                  if recorder.frame_count % WatercupStateMachine.GRIPPER_SNAPSHOT_FRAMES == 0:
+                        recorder.update_gripper(gripper_io.read_status_snapshot())
+                  recorder.record(gsmini, state_machine.state)
+
+      # 读取位移，根据位移大小决定控制器输出
+      scheduler = TickScheduler(rate_hz=30.0)
+      try:
+            scheduler.run(on_tick)
+      except KeyboardInterrupt:
+            print("\n程序被用户中断")
+      finally:
+            gripper_io.stop()
+            recorder.close()
+            gsmini.close()
+            gripper.disconnect()
+            tracer.report()
+            tracer.dump('latency_trace.json')
+
+
+if __name__ == '__main__':
+      main()